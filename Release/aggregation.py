@@ -0,0 +1,160 @@
+# aggregation.py
+import csv, json, os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from gaze_io import load_gaze_data, gaze_file_exists, binary_path_for as gaze_binary_path_for
+from fixations import detect_fixations
+from hit_counts import load_word_hits, binary_path_for as hits_binary_path_for
+from reading_metrics import load_reading_metrics, METRICS_FILENAME
+
+SUMMARY_FILENAME = 'session_summary.json'
+SUMMARY_VERSION = 1
+# Files a session summary is derived from, each with the function naming its binary
+# twin (None if it has none); a change to any of them invalidates the summary
+SOURCE_FILES = (('gazeData_calibrated.txt', gaze_binary_path_for), ('gazeData.txt', gaze_binary_path_for),
+                ('word_hit_counts.txt', hits_binary_path_for), (METRICS_FILENAME, None))
+TREND_METRICS = ('reading_speed_wpm', 'mean_fixation_ms', 'regression_rate', 'skip_rate', 'fixations_per_second')
+
+
+def _source_signature(session_directory):
+    signature = {}
+    for filename, twin_path_for in SOURCE_FILES:
+        path = os.path.join(session_directory, filename)
+        for path in (path, twin_path_for(path)) if twin_path_for else (path,):
+            if os.path.exists(path):
+                stat = os.stat(path)
+                signature[os.path.basename(path)] = [stat.st_size, stat.st_mtime_ns]
+    return signature
+
+
+def gaze_summary(samples, fixations):
+    """Recording statistics of a session from its samples and fixations."""
+    timestamps = samples['timestamp']
+    duration = (int(timestamps[-1]) - int(timestamps[0])) / 1e6
+    return dict(
+        start=int(timestamps[0]),
+        duration_s=duration,
+        sample_count=len(samples),
+        valid_ratio=float(samples['valid'].mean()),
+        fixation_count=len(fixations),
+        mean_fixation_ms=float(fixations['duration'].mean() / 1000) if len(fixations) else None,
+        fixations_per_second=len(fixations) / duration if duration > 0 else None,
+    )
+
+
+def reading_summary(metrics):
+    """Reading speed, regression and skip rates from a per-word metrics table."""
+    read = metrics['fixation_count'] > 0
+    reading_time = metrics['total_reading_time'].sum() / 6e7  # Minutes
+    on_text = int(metrics['fixation_count'].sum())
+    return dict(
+        word_count=len(metrics),
+        words_read=int(read.sum()),
+        reading_speed_wpm=float(read.sum() / reading_time) if reading_time > 0 else None,
+        regression_rate=float(metrics['regressions_in'].sum() / on_text) if on_text else None,
+        skip_rate=float(metrics['skipped'].mean()) if len(metrics) else None,
+    )
+
+
+def summarize_session(session_directory):
+    """Summary statistics of one session, computed from its gaze, hit and metrics files."""
+    summary = {'session': os.path.basename(session_directory), 'path': session_directory}
+    gaze_path = os.path.join(session_directory, 'gazeData_calibrated.txt')
+    summary['calibrated'] = gaze_file_exists(gaze_path)
+    if not summary['calibrated']:
+        gaze_path = os.path.join(session_directory, 'gazeData.txt')
+    samples = load_gaze_data(gaze_path) if gaze_file_exists(gaze_path) else None
+    if samples is None or not len(samples):
+        summary.update(start=None, duration_s=0.0, sample_count=0)
+        return summary
+
+    fixations, _ = detect_fixations(samples)
+    summary.update(gaze_summary(samples, fixations))
+
+    hits_path = os.path.join(session_directory, 'word_hit_counts.txt')
+    if os.path.exists(hits_path) or os.path.exists(hits_binary_path_for(hits_path)):
+        table = load_word_hits(hits_path)
+        summary['word_hit_samples'] = int(np.sum(table.counts))
+        summary['words_hit'] = int(np.count_nonzero(table.counts))
+
+    metrics_path = os.path.join(session_directory, METRICS_FILENAME)
+    if os.path.exists(metrics_path):
+        summary.update(reading_summary(load_reading_metrics(metrics_path)))
+    return summary
+
+
+def _cached_summary(session_directory):
+    summary_path = os.path.join(session_directory, SUMMARY_FILENAME)
+    try:
+        with open(summary_path, 'r') as file:
+            cached = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if cached.get('version') != SUMMARY_VERSION or cached.get('source') != _source_signature(session_directory):
+        return None
+    return cached['summary']
+
+
+def _summarize_and_cache(session_directory):
+    summary = summarize_session(session_directory)
+    cached = {'version': SUMMARY_VERSION, 'source': _source_signature(session_directory), 'summary': summary}
+    try:
+        with open(os.path.join(session_directory, SUMMARY_FILENAME), 'w') as file:
+            json.dump(cached, file)
+    except OSError as e:
+        print(f"Unable to cache session summary: {e}")
+    return summary
+
+
+def list_sessions(user_directory):
+    return sorted(os.path.join(user_directory, name) for name in os.listdir(user_directory)
+                  if os.path.isdir(os.path.join(user_directory, name)))
+
+
+def aggregate_user(user_directory, processes=None):
+    """Summaries of every session of a user, oldest first.
+
+    Sessions whose cached summary is still valid are read from their
+    session_summary.json; the others are summarized in a process pool.
+    """
+    sessions = list_sessions(user_directory)
+    summaries = {session: _cached_summary(session) for session in sessions}
+    stale = [session for session, summary in summaries.items() if summary is None]
+    if len(stale) > 1 and processes != 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            for session, summary in zip(stale, executor.map(_summarize_and_cache, stale)):
+                summaries[session] = summary
+    else:
+        for session in stale:
+            summaries[session] = _summarize_and_cache(session)
+    if stale:
+        print(f"Summarized {len(stale)} new or changed session(s) of {os.path.basename(user_directory)}")
+    recorded = [summary for summary in summaries.values() if summary.get('start') is not None]
+    return sorted(recorded, key=lambda summary: summary['start'])
+
+
+def user_trends(summaries):
+    """Per-metric series over a user's sessions and a least-squares slope per day."""
+    trends = {}
+    days = np.array([summary['start'] for summary in summaries], dtype=np.float64) / 8.64e10
+    for metric in TREND_METRICS:
+        values = np.array([summary.get(metric) if summary.get(metric) is not None else np.nan for summary in summaries], dtype=np.float64)
+        known = np.isfinite(values)
+        slope = None
+        if known.sum() >= 2 and np.ptp(days[known]) > 0:
+            slope = float(np.polyfit(days[known] - days[known][0], values[known], 1)[0])
+        trends[metric] = {'values': values, 'slope_per_day': slope}
+    return trends
+
+
+def write_trends_csv(summaries, file_path):
+    columns = ['session', 'start', 'duration_s', 'sample_count', 'calibrated', 'fixation_count'] + list(TREND_METRICS)
+    with open(file_path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=columns, extrasaction='ignore')
+        writer.writeheader()
+        for summary in summaries:
+            row = dict(summary)
+            row['start'] = str(np.datetime64(summary['start'], 'us'))
+            writer.writerow(row)
@@ -0,0 +1,130 @@
+# analysis.py
+import os
+
+import numpy as np
+
+from gaze_io import load_gaze_data, normalize_gaze_array, gaze_file_exists, binary_path_for
+from hit_counts import write_word_hits
+from word_index import WordIndex
+from fixations import detect_fixations, DEFAULT_VELOCITY_THRESHOLD, DEFAULT_MIN_DURATION, DEFAULT_MAX_GAP
+from reading_metrics import compute_reading_metrics, save_reading_metrics, METRICS_FILENAME
+from session_cache import SessionCache, make_key
+from text_layout import load_session_layout
+
+HIT_COUNTS_FILENAME = 'word_hit_counts.txt'
+# Detection used for the fixations and reading metrics of a session; part of their cache keys
+FIXATION_PARAMETERS = {'method': 'ivt', 'velocity_threshold': DEFAULT_VELOCITY_THRESHOLD,
+                       'min_duration': DEFAULT_MIN_DURATION, 'max_gap': DEFAULT_MAX_GAP}
+
+
+def compute_word_hits(samples, word_boxes, identifiers, screen_width, screen_height):
+    """Assign every gaze sample to a word in one vectorized pass.
+
+    word_boxes is an (N, 4) array of x, y, width, height matching identifiers.
+    Returns {identifier: {'count', 'timestamps', 'coords'}} where timestamps is an
+    int64 array of epoch microseconds and coords the word's top-left corner, or
+    None for words that were never hit.
+    """
+    word_boxes = np.asarray(word_boxes, dtype=np.int64).reshape(-1, 4)
+    valid = samples['valid']
+    screen_xs, screen_ys = normalize_gaze_array(samples['x'][valid], samples['y'][valid], screen_width, screen_height)
+    word_ids = WordIndex(word_boxes).lookup_many(screen_xs, screen_ys)
+
+    hit = word_ids >= 0
+    hit_ids = word_ids[hit]
+    order = np.argsort(hit_ids, kind='stable')
+    counts = np.bincount(hit_ids, minlength=len(identifiers))
+    timestamps = np.split(samples['timestamp'][valid][hit][order], np.cumsum(counts)[:-1])
+
+    word_hits = {}
+    for index, identifier in enumerate(identifiers):
+        coords = (int(word_boxes[index, 0]), int(word_boxes[index, 1])) if counts[index] else None
+        word_hits[identifier] = {'count': int(counts[index]), 'timestamps': timestamps[index], 'coords': coords}
+    return word_hits
+
+
+def word_hits_to_arrays(word_hits):
+    """Flatten a word_hits dict into arrays for SessionCache."""
+    values = list(word_hits.values())
+    timestamps = [np.asarray(data['timestamps'], dtype=np.int64) for data in values]
+    return {
+        'counts': np.array([data['count'] for data in values], dtype=np.int64),
+        'timestamps': np.concatenate(timestamps) if timestamps else np.empty(0, dtype=np.int64),
+        'coords': np.array([data['coords'] or (0, 0) for data in values], dtype=np.int64).reshape(-1, 2),
+        'has_coords': np.array([data['coords'] is not None for data in values], dtype=bool),
+    }
+
+
+def word_hits_from_arrays(arrays, identifiers):
+    timestamps = np.split(arrays['timestamps'], np.cumsum(arrays['counts'])[:-1])
+    word_hits = {}
+    for index, identifier in enumerate(identifiers):
+        coords = tuple(int(value) for value in arrays['coords'][index]) if arrays['has_coords'][index] else None
+        word_hits[identifier] = {'count': int(arrays['counts'][index]), 'timestamps': timestamps[index], 'coords': coords}
+    return word_hits
+
+
+def gaze_source_files(file_path):
+    """The file a gaze log's cache entries are keyed on: the text log, or its binary twin if only that exists."""
+    return [file_path] if os.path.exists(file_path) else [binary_path_for(file_path)]
+
+
+def run_word_analysis(samples, word_boxes, identifiers, words, screen_width, screen_height, cache=None, source_path=None):
+    """Word hits, fixations and reading metrics for samples, reusing cache entries when possible.
+
+    With a SessionCache and the path samples were loaded from, results are keyed
+    on that file's content, the word layout and the screen geometry.
+    """
+    def compute_hits():
+        return word_hits_to_arrays(compute_word_hits(samples, word_boxes, identifiers, screen_width, screen_height))
+
+    def compute_fixations():
+        return {'fixations': detect_fixations(samples, **FIXATION_PARAMETERS)[0]}
+
+    def compute_metrics():
+        return {'metrics': compute_reading_metrics(fixations, word_boxes, identifiers, words, screen_width, screen_height)}
+
+    if cache is None or source_path is None:
+        hit_arrays = compute_hits()
+        fixations = compute_fixations()['fixations']
+        metrics = compute_metrics()['metrics']
+    else:
+        source_files = gaze_source_files(source_path)
+        layout_key = make_key(source_files, boxes=np.asarray(word_boxes, dtype=np.int64), identifiers=list(identifiers),
+                              words=list(words), width=screen_width, height=screen_height)
+        hit_arrays = cache.get_or_compute('word_hits', layout_key, compute_hits)
+        fixations = cache.get_or_compute('fixations', make_key(source_files, **FIXATION_PARAMETERS), compute_fixations)['fixations']
+        metrics_key = make_key(layout=layout_key, **FIXATION_PARAMETERS)  # layout_key already covers the gaze file
+        metrics = cache.get_or_compute('reading_metrics', metrics_key, compute_metrics)['metrics']
+    return word_hits_from_arrays(hit_arrays, identifiers), fixations, metrics
+
+
+def analyze_session(session_directory, word_boxes, identifiers, screen_width, screen_height, words=None, write=True):
+    """Compute word hits and reading metrics for a session without any Qt objects.
+
+    Runs as fast as the data can be processed, independently of playback, and
+    writes word_hit_counts.txt and reading_metrics.npy into the session directory
+    when write is set. Returns (word_hits, metrics), or None without data.
+    """
+    file_path = os.path.join(session_directory, 'gazeData_calibrated.txt')
+    if not gaze_file_exists(file_path):
+        print(f"Calibrated gaze data file not found at {file_path}")
+        return None
+    samples = load_gaze_data(file_path)
+    words = words if words is not None else [''] * len(identifiers)
+    word_hits, _, metrics = run_word_analysis(samples, word_boxes, identifiers, words, screen_width, screen_height,
+                                              cache=SessionCache(session_directory), source_path=file_path)
+    if write:
+        write_word_hits(word_hits, os.path.join(session_directory, HIT_COUNTS_FILENAME))
+        save_reading_metrics(metrics, os.path.join(session_directory, METRICS_FILENAME))
+    return word_hits, metrics
+
+
+def analyze_session_layout(session_directory, write=True):
+    """analyze_session with the text layout saved in the session by the UI."""
+    layout = load_session_layout(session_directory)
+    if layout is None:
+        print(f"No saved text layout in {session_directory}")
+        return None
+    screen_width, screen_height = layout.screen_size
+    return analyze_session(session_directory, layout.boxes, layout.identifiers, screen_width, screen_height, layout.words, write)
@@ -4,14 +4,112 @@ from PyQt5.QtGui import QPainter, QColor, QPen
 from PyQt5.QtCore import QPoint, Qt
 
 import numpy as np
-import sklearn
-import joblib
-from sklearn.preprocessing import PolynomialFeatures
-from sklearn.linear_model import LinearRegression
-from sklearn.pipeline import make_pipeline
 
 from ui_styles import get_button_style, get_exit_button_style
 from config import app_config
+from gaze_io import load_gaze_data, format_timestamps, gaze_file_exists, write_gaze_binary, binary_path_for
+from calibration_model import MODEL_FILENAME, fit_calibration, robust_dot_estimate, save_calibration, load_calibration, has_calibration
+from session_index import index_session
+
+# Dot positions in the tracker's -1..1 coordinate system, in the order they are shown
+CALIBRATION_DOTS = [
+    (-0.6, -0.5), (0.6, -0.5), (-0.6, 0.5), (0.6, 0.5),
+    (0.0, -0.5), (0.0, 0.5), (0.0, 0.0),
+    (-0.6, 0.0), (0.6, 0.0),
+    (-0.6, -0.25), (0.6, -0.25), (-0.6, 0.25), (0.6, 0.25),
+    (-0.3, -0.25), (0.3, -0.25), (-0.3, 0.25), (0.3, 0.25)  # New dots added in the middle at 0.3 and -0.3
+]
+
+
+def fit_session_calibration(directory, dots=CALIBRATION_DOTS):
+    """Fit and save the calibration model of a session from its gazeData_<dot>.txt files.
+
+    Every dot file is reduced to a robust (trimmed median) gaze estimate; the
+    polynomial degree is picked by leave-one-dot-out cross-validation. Writes
+    calibration_results.txt with per-dot residuals and returns the CalibrationFit,
+    or None if no dot data was found.
+    """
+    indices, measured_points, expected_points = [], [], []
+    for index, expected in enumerate(dots):
+        file_path = os.path.join(directory, f'gazeData_{index}.txt')
+        if not gaze_file_exists(file_path):
+            print(f"File not found: {file_path}")
+            continue
+        samples = load_gaze_data(file_path)
+        centre, _ = robust_dot_estimate(np.column_stack((samples['x'][samples['valid']], samples['y'][samples['valid']])))
+        if centre is not None:
+            indices.append(index)
+            measured_points.append(centre)
+            expected_points.append(expected)
+    if not measured_points:
+        return None
+
+    measured_points, expected_points = np.array(measured_points), np.array(expected_points)
+    fit = fit_calibration(measured_points, expected_points)
+    with open(os.path.join(directory, 'calibration_results.txt'), 'w') as result_file:
+        result_file.write("Calibration Results:\n")
+        result_file.write(f"Polynomial degree: {fit.model.degree} (leave-one-dot-out error by degree: "
+                          + ", ".join(f"{degree}: {error:.4f}" for degree, error in fit.cv_errors.items()) + ")\n")
+        result_file.write("Dot Index, Expected (X,Y), Measured (X,Y), Distance, Fit Residual, Left-Out Residual\n")
+        for row, index in enumerate(indices):
+            expected, measured = dots[index], tuple(round(float(value), 6) for value in measured_points[row])
+            distance = float(np.hypot(*(measured_points[row] - expected_points[row])))
+            result_file.write(f"{index}, {expected}, {measured}, {distance:.2f}, {fit.residuals[row]:.4f}, {fit.loo_residuals[row]:.4f}\n")
+    save_calibration(fit, os.path.join(directory, MODEL_FILENAME), measured_points, expected_points)
+    return fit
+
+
+def apply_calibration(model, samples):
+    """Return a copy of samples with every valid point mapped through model in one call."""
+    calibrated = np.array(samples, dtype=samples.dtype)
+    valid = calibrated['valid']
+    if valid.any():
+        points = np.column_stack((calibrated['x'][valid], calibrated['y'][valid]))
+        transformed = model.predict(points)
+        calibrated['x'][valid] = transformed[:, 0]
+        calibrated['y'][valid] = transformed[:, 1]
+    return calibrated
+
+
+def write_calibrated_gaze_data(samples, transformed_file):
+    """Write calibrated samples as text in one buffered write, plus its binary twin."""
+    timestamp_strs = format_timestamps(samples['timestamp']).tolist()
+    lines = [f"[{ts}] Gaze point: [{x}, {y}]\n" for ts, x, y in zip(timestamp_strs, samples['x'].tolist(), samples['y'].tolist())]
+    with open(transformed_file, 'w') as outfile:
+        outfile.write(''.join(lines))
+    write_gaze_binary(samples, binary_path_for(transformed_file))
+
+
+def calibrate_session(session_directory, model=None):
+    """Calibrate gazeData.txt of one session into gazeData_calibrated.txt.
+
+    Returns True if the session had both a model and gaze data to transform.
+    """
+    if model is None:
+        model = load_calibration(session_directory)
+        if model is None:
+            print(f"No calibration model found in {session_directory}")
+            return False
+    original_file = os.path.join(session_directory, 'gazeData.txt')
+    if not gaze_file_exists(original_file):
+        print(f"Gaze data file not found at {original_file}")
+        return False
+    samples = load_gaze_data(original_file)
+    write_calibrated_gaze_data(apply_calibration(model, samples), os.path.join(session_directory, 'gazeData_calibrated.txt'))
+    index_session(session_directory)
+    return True
+
+
+def calibrate_sessions(directory):
+    """Calibrate every session found in directory (or directory itself if it is a session)."""
+    if has_calibration(directory):
+        session_directories = [directory]
+    else:
+        session_directories = [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                               if has_calibration(os.path.join(directory, name))]
+    calibrated = [session for session in session_directories if calibrate_session(session)]
+    print(f"Calibrated {len(calibrated)} of {len(session_directories)} session(s) in {directory}")
+    return calibrated
 
 class CalibrationScreen(QWidget):
     
@@ -19,13 +117,7 @@ class CalibrationScreen(QWidget):
         super().__init__(parent)
         self.setFixedSize(parent.size())  # Match the parent size
         self.session_directory = app_config.session_directory  # Save the session directory
-        self.dots = [
-            (-0.6, -0.5), (0.6, -0.5), (-0.6, 0.5), (0.6, 0.5),
-            (0.0, -0.5), (0.0, 0.5), (0.0, 0.0),
-            (-0.6, 0.0), (0.6, 0.0),
-            (-0.6, -0.25), (0.6, -0.25), (-0.6, 0.25), (0.6, 0.25),
-            (-0.3, -0.25), (0.3, -0.25), (-0.3, 0.25), (0.3, 0.25)  # New dots added in the middle at 0.3 and -0.3
-        ]
+        self.dots = list(CALIBRATION_DOTS)
 
         self.current_dot = 0
         self.parent = parent  # This will reference the GazeVisualizer instance
@@ -126,84 +218,21 @@ class CalibrationScreen(QWidget):
             print("No session directory set for calibration.")
             return
 
-        results_path = os.path.join(directory, 'calibration_results.txt')
-        print("Debug: Results path -", results_path)
-        measured_points = []
-        expected_points = []
         try:
-            with open(results_path, 'w') as result_file:
-                result_file.write("Calibration Results:\n")
-                result_file.write("Dot Index, Expected (X,Y), Measured (X,Y), Distance\n")
-                for index, expected in enumerate(self.dots):
-                    file_path = os.path.join(directory, f'gazeData_{index}.txt')
-                    print(f"Debug: Attempting to access file - {file_path}")
-                    if os.path.exists(file_path):
-                        gaze_points = self.read_gaze_data(file_path)
-                        average_gaze_point = self.calculate_average_gaze_point(gaze_points, expected)
-                        if average_gaze_point != (None, None):
-                            measured_points.append(average_gaze_point)
-                            expected_points.append(expected)
-                            distance = self.calculate_distance(average_gaze_point, expected)
-                            result_file.write(f"{index}, {expected}, {average_gaze_point}, {distance:.2f}\n")
-                    else:
-                        print(f"File not found: {file_path}")
-
-            if measured_points and expected_points:
-                self.fit_polynomial_regression(np.array(measured_points), np.array(expected_points))
+            fit = fit_session_calibration(directory, self.dots)
+            if fit:
+                print(f"Calibration model (degree {fit.model.degree}) saved, mean left-out residual {fit.loo_residuals.mean():.4f}")
                 original_file = os.path.join(directory, 'gazeData.txt')
                 transformed_file = os.path.join(directory, 'gazeData_calibrated.txt')
                 self.preprocess_gaze_data(original_file, transformed_file)
+                index_session(directory)
         except Exception as e:
             print(f"Error during calibration data analysis: {e}")
 
-    def fit_polynomial_regression(self, measured_points, expected_points, degree=2):
-        model = make_pipeline(PolynomialFeatures(degree), LinearRegression())
-        model.fit(measured_points, expected_points)
-        directory = app_config.session_directory
-        if not directory:
-            print("No session directory set for saving the polynomial regression model.")
-            return
-        model_path = os.path.join(directory, 'polynomial_regression_model.pkl')  # Ensure model is saved in the session directory
-        joblib.dump(model, model_path)  # Save the model to disk
-        print(f"Polynomial regression model saved at: {model_path}")
-
-    def read_gaze_data(self, file_path):
-        gaze_points = []
-        with open(file_path, 'r') as file:
-            for line in file:
-                if 'Gaze point:' in line:
-                    _, coords = line.split('Gaze point:')
-                    x, y = map(float, coords.strip(' []\n').split(','))
-                    # Directly append the x and y values as they are read
-                    gaze_points.append((x, y))
-        return gaze_points
-
-    def calculate_average_gaze_point(self, gaze_points, expected):
-        # Filter gaze points based on the threshold before averaging
-        threshold = 0.15
-        filtered_points = [point for point in gaze_points if abs(point[0] - expected[0]) <= threshold and abs(point[1] - expected[1]) <= threshold]
-        if not filtered_points:
-            return (None, None)
-        total_x = sum(x for x, _ in filtered_points)
-        total_y = sum(y for _, y in filtered_points)
-        count = len(filtered_points)
-        return (total_x / count, total_y / count) if count > 0 else (None, None)
-
-    def calculate_distance(self, measured, expected):
-        if not measured or None in measured:  # Check if measured is None or contains None
-            return float('inf')  # Return 'infinite' distance to indicate no valid measurement
-        return ((measured[0] - expected[0])**2 + (measured[1] - expected[1])**2)**0.5
-
     def preprocess_gaze_data(self, original_file, transformed_file):
-        model_path = os.path.join(self.session_directory, 'polynomial_regression_model.pkl')
-        if os.path.exists(model_path):
-            model = joblib.load(model_path)  # Load the model from the user-specific directory
-            with open(original_file, 'r') as infile, open(transformed_file, 'w') as outfile:
-                for line in infile:
-                    if 'Gaze point:' in line:
-                        timestamp_part, gaze_part = line.split('Gaze point:')
-                        x, y = map(float, gaze_part.strip(' []\n').split(','))
-                        transformed = model.predict([[x, y]])[0]
-                        outfile.write(f"{timestamp_part}Gaze point: [{transformed[0]}, {transformed[1]}]\n")
+        model = load_calibration(self.session_directory)  # Load the model from the user-specific directory
+        if model is not None:
+            samples = load_gaze_data(original_file)
+            write_calibrated_gaze_data(apply_calibration(model, samples), transformed_file)
         else:
-            print(f"Model file not found at {model_path}")
+            print(f"No calibration model found in {self.session_directory}")
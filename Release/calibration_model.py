@@ -0,0 +1,169 @@
+# calibration_model.py
+import os, time
+
+import numpy as np
+
+# Calibration models are saved as plain arrays in an .npz file (loaded with
+# allow_pickle=False), so applying a calibration needs neither sklearn nor unpickling.
+MODEL_FILENAME = 'calibration_model.npz'
+LEGACY_MODEL_FILENAME = 'polynomial_regression_model.pkl'  # joblib-pickled sklearn pipeline
+MODEL_FORMAT_VERSION = 1
+
+DEFAULT_DEGREES = (1, 2, 3)
+MIN_INLIER_RADIUS = 0.02  # Never trim samples closer than this to the dot estimate
+TRIM_SIGMAS = 2.5
+TRIM_ITERATIONS = 3
+
+
+def polynomial_terms(degree):
+    """(x power, y power) of every monomial up to degree, in PolynomialFeatures order."""
+    return [(total - y_power, y_power) for total in range(degree + 1) for y_power in range(total + 1)]
+
+
+def design_matrix(points, degree):
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    powers = np.array(polynomial_terms(degree))
+    return points[:, :1] ** powers[:, 0] * points[:, 1:] ** powers[:, 1]
+
+
+class PolynomialCalibration:
+    """ Maps measured gaze points to screen coordinates with a 2-D polynomial.
+
+    coefficients has one row per polynomial_terms(degree) monomial and one column
+    per output coordinate; predict() is a single matrix product.
+    """
+    def __init__(self, degree, coefficients, fitted_at=None, residuals=None):
+        self.degree = int(degree)
+        self.coefficients = np.asarray(coefficients, dtype=np.float64)
+        self.fitted_at = fitted_at  # ISO 8601 local time of the fit
+        self.residuals = residuals  # Per-dot fit residuals, if known
+
+    def predict(self, points):
+        return design_matrix(points, self.degree) @ self.coefficients
+
+
+def robust_dot_estimate(points):
+    """Median-centred estimate of where the user looked for one calibration dot.
+
+    Samples further than TRIM_SIGMAS robust standard deviations (from the median
+    absolute distance) from the current estimate are trimmed, which drops the
+    saccade onto the dot and any glances away. Returns (centre, inlier count) or
+    (None, 0) without samples.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    points = points[np.all(np.isfinite(points), axis=1)]
+    if not len(points):
+        return None, 0
+    inliers = points
+    centre = np.median(points, axis=0)
+    for _ in range(TRIM_ITERATIONS):
+        distances = np.hypot(*(points - centre).T)
+        radius = max(TRIM_SIGMAS * 1.4826 * np.median(distances), MIN_INLIER_RADIUS)
+        inliers = points[distances <= radius]
+        centre = np.median(inliers, axis=0)
+    return centre, len(inliers)
+
+
+def _fit_with_loo(measured, expected, degree):
+    """Least-squares fit plus exact leave-one-dot-out residuals from the hat matrix."""
+    design = design_matrix(measured, degree)
+    coefficients, _, rank, _ = np.linalg.lstsq(design, expected, rcond=None)
+    if rank < design.shape[1]:
+        return coefficients, None
+    residuals = expected - design @ coefficients
+    leverage = np.einsum('ij,ji->i', design, np.linalg.pinv(design))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        loo_residuals = residuals / (1 - leverage)[:, None]
+    if not np.all(np.isfinite(loo_residuals)):
+        return coefficients, None
+    return coefficients, loo_residuals
+
+
+class CalibrationFit:
+    """ Result of fit_calibration: the chosen model plus per-dot diagnostics. """
+    def __init__(self, model, residuals, loo_residuals, cv_errors):
+        self.model = model
+        self.residuals = residuals  # (dots,) distance between fitted and expected position
+        self.loo_residuals = loo_residuals  # (dots,) same distance with the dot left out of the fit
+        self.cv_errors = cv_errors  # {degree: mean leave-one-dot-out distance}
+
+
+def fit_calibration(measured, expected, degrees=DEFAULT_DEGREES):
+    """Fit a PolynomialCalibration, choosing the degree by leave-one-dot-out cross-validation.
+
+    Degrees with at least as many terms as dots are skipped, since every dot would
+    be fitted exactly and the cross-validation error is undefined.
+    """
+    measured = np.asarray(measured, dtype=np.float64).reshape(-1, 2)
+    expected = np.asarray(expected, dtype=np.float64).reshape(-1, 2)
+    best = None
+    cv_errors = {}
+    for degree in degrees:
+        if len(polynomial_terms(degree)) >= len(measured):
+            continue
+        coefficients, loo_residuals = _fit_with_loo(measured, expected, degree)
+        if loo_residuals is None:
+            continue
+        loo_distances = np.hypot(*loo_residuals.T)
+        cv_errors[degree] = float(loo_distances.mean())
+        if best is None or cv_errors[degree] < cv_errors[best[0]]:
+            best = (degree, coefficients, loo_distances)
+    if best is None:
+        raise ValueError(f"Not enough calibration dots ({len(measured)}) for any of degrees {tuple(degrees)}")
+
+    degree, coefficients, loo_distances = best
+    model = PolynomialCalibration(degree, coefficients)
+    residuals = np.hypot(*(model.predict(measured) - expected).T)
+    return CalibrationFit(model, residuals, loo_distances, cv_errors)
+
+
+def save_calibration(fit, file_path, measured=None, expected=None):
+    """Save a CalibrationFit as a versioned .npz file of coefficients and diagnostics."""
+    fitted_at = fit.model.fitted_at or time.strftime('%Y-%m-%dT%H:%M:%S')
+    arrays = {
+        'format_version': np.array(MODEL_FORMAT_VERSION),
+        'degree': np.array(fit.model.degree),
+        'coefficients': fit.model.coefficients,
+        'fitted_at': np.array(fitted_at),
+        'residuals': np.asarray(fit.residuals, dtype=np.float64),
+        'loo_residuals': np.asarray(fit.loo_residuals, dtype=np.float64),
+        'cv_degrees': np.array(list(fit.cv_errors), dtype=np.int32),
+        'cv_errors': np.array(list(fit.cv_errors.values()), dtype=np.float64),
+    }
+    if measured is not None:
+        arrays['measured'] = np.asarray(measured, dtype=np.float64)
+        arrays['expected'] = np.asarray(expected, dtype=np.float64)
+    temporary_path = file_path + '.tmp.npz'
+    np.savez(temporary_path, **arrays)
+    os.replace(temporary_path, file_path)
+    fit.model.fitted_at = fitted_at
+
+
+def read_calibration(file_path):
+    """Load a PolynomialCalibration saved by save_calibration."""
+    with np.load(file_path, allow_pickle=False) as data:
+        version = int(data['format_version'])
+        if version > MODEL_FORMAT_VERSION:
+            raise ValueError(f"Unsupported calibration model version {version} in {file_path}")
+        return PolynomialCalibration(int(data['degree']), data['coefficients'], fitted_at=str(data['fitted_at']),
+                                     residuals=data['residuals'] if 'residuals' in data.files else None)
+
+
+def has_calibration(session_directory):
+    return any(os.path.exists(os.path.join(session_directory, name)) for name in (MODEL_FILENAME, LEGACY_MODEL_FILENAME))
+
+
+def load_calibration(session_directory):
+    """The calibration model of a session, or None if it has none.
+
+    Sessions calibrated before the .npz format only have the pickled sklearn
+    pipeline; it is loaded through joblib (importing sklearn) only in that case.
+    """
+    model_path = os.path.join(session_directory, MODEL_FILENAME)
+    if os.path.exists(model_path):
+        return read_calibration(model_path)
+    legacy_path = os.path.join(session_directory, LEGACY_MODEL_FILENAME)
+    if os.path.exists(legacy_path):
+        import joblib
+        return joblib.load(legacy_path)
+    return None
@@ -0,0 +1,116 @@
+# comparison.py
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from gaze_io import load_gaze_data, normalize_gaze_array, gaze_file_exists
+from heatmap import compute_density
+from analysis import gaze_source_files
+from session_cache import SessionCache, make_key
+
+GAZE_FILENAME = 'gazeData_calibrated.txt'
+
+
+def _heatmap_key(file_path, width, height, bin_size):
+    return make_key(gaze_source_files(file_path), width=width, height=height, bin_size=bin_size, valid_only=True)
+
+
+def session_density(session_directory, width, height, bin_size, compute=True):
+    """Heatmap count grid of a session's calibrated gaze data, or None without data.
+
+    The grid is stored in the session cache under 'heatmap', keyed on the gaze
+    file and the screen geometry, so it is shared with showHeatmapOnText. With
+    compute=False only a cached grid is returned.
+    """
+    file_path = os.path.join(session_directory, GAZE_FILENAME)
+    if not gaze_file_exists(file_path):
+        return None
+    cache = SessionCache(session_directory)
+    key = _heatmap_key(file_path, width, height, bin_size)
+    cached = cache.get('heatmap', key)
+    if cached is not None or not compute:
+        return cached['density'] if cached is not None else None
+
+    samples = load_gaze_data(file_path)
+    samples = samples[samples['valid']]
+    screen_xs, screen_ys = normalize_gaze_array(samples['x'], samples['y'], width, height)
+    density = compute_density(screen_xs, screen_ys, width, height, bin_size)
+    cache.put('heatmap', key, density=density)
+    return density
+
+
+def _session_density_job(arguments):
+    return session_density(*arguments)
+
+
+def session_densities(session_directories, width, height, bin_size, processes=None):
+    """{session directory: count grid} for every session that has calibrated gaze data.
+
+    Grids missing from the session caches are computed in a process pool.
+    """
+    grids = {session: session_density(session, width, height, bin_size, compute=False) for session in session_directories}
+    stale = [session for session, grid in grids.items()
+             if grid is None and gaze_file_exists(os.path.join(session, GAZE_FILENAME))]
+    jobs = [(session, width, height, bin_size) for session in stale]
+    if len(jobs) > 1 and processes != 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            grids.update(zip(stale, executor.map(_session_density_job, jobs)))
+    else:
+        grids.update(zip(stale, map(_session_density_job, jobs)))
+    missing = [os.path.basename(session) for session, grid in grids.items() if grid is None]
+    if missing:
+        print(f"No calibrated gaze data in: {', '.join(missing)}")
+    return {session: grid for session, grid in grids.items() if grid is not None}
+
+
+def normalize_density(grid):
+    """Share of the session's gaze samples per bin, so sessions of different length compare."""
+    total = grid.sum()
+    return grid / total if total > 0 else grid
+
+
+def average_density(grids):
+    """Mean of the normalized grids (each session weighs the same)."""
+    return np.mean([normalize_density(grid) for grid in grids], axis=0)
+
+
+def difference_density(after, before):
+    """Normalized after minus normalized before; positive where gaze increased."""
+    return normalize_density(after) - normalize_density(before)
+
+
+def session_sort_key(session_directory):
+    """Sessions are named by creation time (dd_mm_yyyy_hh_mm); unparsable names sort last."""
+    name = os.path.basename(session_directory)
+    try:
+        return (0, datetime.strptime(name, "%d_%m_%Y_%H_%M"), name)
+    except ValueError:
+        return (1, datetime.min, name)
+
+
+def comparison_views(groups, width, height, bin_size, processes=None):
+    """Named heatmap grids comparing groups of sessions.
+
+    groups maps a label (a session or a user) to its session directories, in
+    chronological order. Returns [(name, grid, signed)] with one averaged grid per
+    group, the average over all groups and, for two or more groups, the
+    difference between the last and the first group.
+    """
+    sessions = [session for group in groups.values() for session in group]
+    densities = session_densities(sessions, width, height, bin_size, processes)
+    averages = {}
+    for label, group in groups.items():
+        grids = [densities[session] for session in group if session in densities]
+        if grids:
+            averages[label] = average_density(grids)
+    if not averages:
+        return []
+
+    views = [(label, grid, False) for label, grid in averages.items()]
+    if len(averages) > 1:
+        labels = list(averages)
+        views.append(("Average of " + ", ".join(labels), np.mean(list(averages.values()), axis=0), False))
+        views.append((f"{labels[-1]} minus {labels[0]}", difference_density(averages[labels[-1]], averages[labels[0]]), True))
+    return views
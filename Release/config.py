@@ -1,7 +1,15 @@
 # config.py
+import os, shlex
+
+DEFAULT_RECORDER = "/Users/borana/Documents/GitHub/DyslexiaProject/Release/cpp_exec/Tobii_api_test1"
+DEFAULT_DATA_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
 class AppConfig:
     def __init__(self):
         self._session_directory = None
+        # GAZE_RECORDER swaps the Tobii binary for another command, e.g. replay_recorder.py
+        self._recorder_command = shlex.split(os.environ.get("GAZE_RECORDER", "")) or [DEFAULT_RECORDER]
+        self._data_root = os.environ.get("GAZE_DATA_ROOT", DEFAULT_DATA_ROOT)  # Holds the <user>_data folders
 
     @property
     def session_directory(self):
@@ -11,6 +19,22 @@ class AppConfig:
     def session_directory(self, value):
         self._session_directory = value
 
+    @property
+    def recorder_command(self):
+        return list(self._recorder_command)
+
+    @recorder_command.setter
+    def recorder_command(self, value):
+        self._recorder_command = list(value)
+
+    @property
+    def data_root(self):
+        return self._data_root
+
+    @data_root.setter
+    def data_root(self, value):
+        self._data_root = value
+
 # Singleton instance
 app_config = AppConfig()
 
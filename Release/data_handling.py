@@ -1,73 +1,158 @@
-import sys, time, os
-from datetime import datetime
+import sys, time, os, threading
 from PyQt5.QtCore import QThread, pyqtSignal
 import numpy as np
-import matplotlib.pyplot as plt
 
-def normalize_gaze_to_screen(gaze_point, screen_width, screen_height):
-    x, y = gaze_point
-    x_scale = max(abs(x), 1)
-    y_scale = max(abs(y), 1)
-    screen_x = int(((x / x_scale) + 1) / 2 * screen_width)
-    screen_y = int((1 - (y / y_scale)) / 2 * screen_height)
-    return screen_x, screen_y
+from gaze_io import normalize_gaze_array
+from analysis import run_word_analysis, HIT_COUNTS_FILENAME
+from hit_counts import write_word_hits, load_word_hits
+from playback import PlaybackClock
+from reading_metrics import save_reading_metrics, METRICS_FILENAME
+from session_cache import SessionCache
 
 def parse_word_hit_counts(file_path):
+    """Hit counts as a list of {'coords', 'count', 'timestamps'} in reading order.
+
+    coords is the (y, x) pair encoded in the word identifier; timestamps are int64
+    epoch microseconds. Reads the compact binary file when it is current.
+    """
+    table = load_word_hits(file_path)
     word_hit_data = []
-    with open(file_path, 'r') as file:
-        for line in file:
-            parts = line.strip().split(' - ')
-            identifier, count_str = parts[0], parts[1]
-            timestamps_str = parts[3] if len(parts) > 3 else ""
-            coords = tuple(map(float, identifier.split('-')))
-            count = int(count_str.split(': ')[1])
-            timestamps = timestamps_str.split(', ')
-            word_hit_data.append({'coords': coords, 'count': count, 'timestamps': timestamps})
+    for index, identifier in enumerate(table.identifiers.tolist()):
+        coords = tuple(map(float, identifier.split('-')))
+        word_hit_data.append({'coords': coords, 'count': int(table.counts[index]), 'timestamps': table.hits(index)})
     return word_hit_data
 
+# Played samples as sent to the UI: epoch microseconds and screen pixels
+PLAYBACK_DTYPE = np.dtype([('timestamp', np.int64), ('x', np.int32), ('y', np.int32)])
+
 class GazeDataProcessor(QThread):
-    update_gaze_signal = pyqtSignal(datetime, int, int)
+    samples_played = pyqtSignal(object)  # PLAYBACK_DTYPE array of the samples that fell due since the last batch
+
+    MAX_IDLE = 0.05  # Longest sleep, keeps pause/seek/speed changes responsive
+    MAX_FRAME_WAIT = 0.25  # Give up waiting for frame_presented() after this long
 
-    def __init__(self, gaze_data, screen_width, screen_height, word_labels, user_directory=None):
+    def __init__(self, gaze_data=None, screen_width=0, screen_height=0, word_layout=None, user_directory=None, buffer=None,
+                 frame_interval=1.0 / 60):
         super().__init__()
+        self.frame_interval = frame_interval  # At most one batch per display frame
+        self._stop_event = threading.Event()
+        self.buffer = buffer  # Optional shared GazeRingBuffer that receives played samples
+        self.word_hits = None
+        self.reading_metrics = None
+        self.clock = None
+        if gaze_data is not None:
+            self.load(gaze_data, screen_width, screen_height, word_layout, user_directory)
+
+    def load(self, gaze_data, screen_width, screen_height, word_layout, user_directory=None, source_path=None):
+        """Prepare a new session for playback. The worker must not be running.
+
+        With source_path (the file gaze_data was loaded from) analysis results are
+        reused from the session cache of user_directory.
+        """
+        if self.isRunning():
+            raise RuntimeError("Cannot load gaze data while playback is running")
         self.gaze_data = gaze_data
         self.screen_width = screen_width
         self.screen_height = screen_height
-        self.word_labels = word_labels
+        self.word_layout = word_layout
         self.user_directory = user_directory
-        self.word_hits = {label[0]: {'count': 0, 'timestamps': [], 'coords': None} for label in word_labels}
-        self.label_geometries = self._compute_label_geometries()
+        self.identifiers = word_layout.identifiers
+        self.word_boxes = word_layout.boxes
+        # Hit counting is done up front by the headless analysis; run() only paces playback
+        words = word_layout.words
+        cache = SessionCache(user_directory) if user_directory and source_path else None
+        self.word_hits, _, self.reading_metrics = run_word_analysis(
+            gaze_data, self.word_boxes, self.identifiers, words, screen_width, screen_height, cache=cache, source_path=source_path)
+
+        valid_samples = gaze_data[gaze_data['valid']]
+        self.valid_samples = valid_samples
+        screen_xs, screen_ys = normalize_gaze_array(valid_samples['x'], valid_samples['y'], screen_width, screen_height)
+        self.screen_samples = np.empty(len(valid_samples), dtype=PLAYBACK_DTYPE)
+        self.screen_samples['timestamp'] = valid_samples['timestamp']
+        self.screen_samples['x'] = screen_xs
+        self.screen_samples['y'] = screen_ys
+        self.clock = PlaybackClock(valid_samples['timestamp'])
+        self._frame_pending_since = None
+        self._stop_event.clear()  # Here rather than in run(), so a stop() right after start() is not lost
+
+    def play(self, gaze_data, screen_width, screen_height, word_layout, user_directory=None, source_path=None):
+        """Stop any running playback, then start the given session on this worker.
+
+        Returns False if the previous playback did not stop in time.
+        """
+        if not self.stop():
+            return False
+        self.load(gaze_data, screen_width, screen_height, word_layout, user_directory, source_path)
+        self.start()
+        return True
+
+    def stop(self, timeout_ms=2000):
+        """Ask the playback loop to exit at its next check and wait for it.
 
-    def _compute_label_geometries(self):
-        geometries = {}
-        for identifier, label_obj, word in self.word_labels:
-            geometries[identifier] = label_obj.geometry()
-        return geometries
+        Returns True once the worker is stopped, False if it is still running
+        after timeout_ms.
+        """
+        self._stop_event.set()
+        if self.isRunning() and not self.wait(timeout_ms):
+            print(f"Playback did not stop within {timeout_ms} ms.")
+            return False
+        return True
+
+    def frame_presented(self):
+        """Called by the UI once it has drawn the last emitted batch."""
+        self._frame_pending_since = None
+
+    def _ready_for_frame(self):
+        pending_since = self._frame_pending_since
+        return pending_since is None or time.monotonic() - pending_since > self.MAX_FRAME_WAIT
 
     def run(self):
-        for line in self.gaze_data:
-            timestamp_str, gaze_str = line.split('] Gaze point: ')
-            timestamp = datetime.strptime(timestamp_str[1:], "%Y-%m-%d %H:%M:%S.%f")
-            gaze_point = [float(val) for val in gaze_str.strip()[1:-1].split(',')]
-            screen_x, screen_y = normalize_gaze_to_screen(gaze_point, self.screen_width, self.screen_height)
-
-            for identifier, geometry in self.label_geometries.items():
-                if geometry.contains(screen_x, screen_y):
-                    if self.word_hits[identifier]['coords'] is None:
-                        self.word_hits[identifier]['coords'] = (geometry.x(), geometry.y())
-                    self.word_hits[identifier]['count'] += 1
-                    self.word_hits[identifier]['timestamps'].append(timestamp.strftime("%Y-%m-%d %H:%M:%S.%f"))
-
-            self.update_gaze_signal.emit(timestamp, screen_x, screen_y)
-            time.sleep(0.02)
-
-    def write_hit_counts_to_file(self, filename='word_hit_counts.txt'):
+        count = len(self.screen_samples)
+        if not count:
+            return
+        self.clock.resume()
+        last_index = -1
+        next_frame = 0.0
+        while not self._stop_event.is_set():
+            # Samples that fell due are sent as one batch per frame; while the UI is
+            # still drawing the previous batch they accumulate into the next one.
+            index = self.clock.current_index()
+            now = time.monotonic()
+            if index >= 0 and index != last_index and now >= next_frame and self._ready_for_frame():
+                self._frame_pending_since = now
+                next_frame = now + self.frame_interval
+                start = last_index + 1 if index > last_index else index  # Seeking backwards restarts the history
+                self._buffer_played(start, index, restart=index < last_index)
+                self.samples_played.emit(self.screen_samples[start:index + 1])
+                last_index = index
+            if last_index == count - 1 and self.clock.at_end():
+                break
+            wait = self.clock.seconds_until(index + 1)
+            if index != last_index:
+                wait = min(wait, max(next_frame - now, 0.005))  # A due batch is waiting for the next frame
+            self._stop_event.wait(min(wait, self.MAX_IDLE))
+        # word_hits and reading_metrics are computed in full by load() and never
+        # mutated here, so the files are consistent whether playback finished or
+        # was stopped early.
+        self.write_hit_counts_to_file()
+        self.write_reading_metrics()
+
+    def _buffer_played(self, start, index, restart=False):
+        if self.buffer is None:
+            return
+        if restart:
+            self.buffer.clear()
+        self.buffer.extend(self.valid_samples[start:index + 1])
+
+    def write_hit_counts_to_file(self, filename=HIT_COUNTS_FILENAME):
+        if self.word_hits is None:
+            return
         if not self.user_directory:
             print("User directory not set. Cannot write hit counts.")
             return
-        file_path = os.path.join(self.user_directory, filename)
-        with open(file_path, 'w') as file:
-            for key, data in self.word_hits.items():
-                coords_str = f" - Coords: {data['coords'][0]}, {data['coords'][1]}" if data['coords'] else ""
-                timestamps_str = ', '.join(data['timestamps'])
-                file.write(f"{key}: {data['count']}{coords_str} - Timestamps: {timestamps_str}\n")
+        write_word_hits(self.word_hits, os.path.join(self.user_directory, filename))
+
+    def write_reading_metrics(self, filename=METRICS_FILENAME):
+        if self.reading_metrics is None or not self.user_directory:
+            return
+        save_reading_metrics(self.reading_metrics, os.path.join(self.user_directory, filename))
@@ -0,0 +1,221 @@
+# fixations.py
+import numpy as np
+
+# Coordinates and thresholds are in the units of the samples passed in (normalized
+# tracker space for gazeData*.txt); times are epoch microseconds like GAZE_DTYPE.
+FIXATION_DTYPE = np.dtype([
+    ('start', np.int64), ('end', np.int64), ('duration', np.int64),
+    ('x', np.float64), ('y', np.float64),
+    ('start_index', np.int64), ('end_index', np.int64),
+])
+SACCADE_DTYPE = np.dtype([
+    ('start', np.int64), ('end', np.int64), ('duration', np.int64),
+    ('start_x', np.float64), ('start_y', np.float64),
+    ('end_x', np.float64), ('end_y', np.float64), ('amplitude', np.float64),
+])
+
+DEFAULT_VELOCITY_THRESHOLD = 1.5  # Units per second
+DEFAULT_DISPERSION_THRESHOLD = 0.1  # (max x - min x) + (max y - min y)
+DEFAULT_MIN_DURATION = 0.1  # Seconds
+DEFAULT_MAX_GAP = 0.1  # Seconds without samples that always ends a fixation
+
+
+def _valid_arrays(samples):
+    valid = samples[samples['valid']]
+    return valid['timestamp'].astype(np.int64), valid['x'].astype(np.float64), valid['y'].astype(np.float64)
+
+
+def _build_fixations(t, x, y, starts, ends):
+    """Fixations spanning samples starts[i]..ends[i] (inclusive), centroids from prefix sums."""
+    cumulative_x = np.concatenate(([0.0], np.cumsum(x)))
+    cumulative_y = np.concatenate(([0.0], np.cumsum(y)))
+    counts = ends - starts + 1
+    fixations = np.empty(len(starts), dtype=FIXATION_DTYPE)
+    fixations['start'] = t[starts]
+    fixations['end'] = t[ends]
+    fixations['duration'] = t[ends] - t[starts]
+    fixations['x'] = (cumulative_x[ends + 1] - cumulative_x[starts]) / counts
+    fixations['y'] = (cumulative_y[ends + 1] - cumulative_y[starts]) / counts
+    fixations['start_index'] = starts
+    fixations['end_index'] = ends
+    return fixations
+
+
+def detect_fixations_ivt(samples, velocity_threshold=DEFAULT_VELOCITY_THRESHOLD,
+                         min_duration=DEFAULT_MIN_DURATION, max_gap=DEFAULT_MAX_GAP):
+    """Velocity-threshold (I-VT) fixation detection over a GAZE_DTYPE array.
+
+    Consecutive samples moving slower than velocity_threshold form a fixation;
+    runs shorter than min_duration seconds are discarded. Fully vectorized.
+    """
+    t, x, y = _valid_arrays(samples)
+    if len(t) < 2:
+        return np.empty(0, dtype=FIXATION_DTYPE)
+    dt = np.diff(t) / 1e6
+    distance = np.hypot(np.diff(x), np.diff(y))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        velocity = np.where(dt > 0, distance / dt, np.where(distance > 0, np.inf, 0.0))
+    slow = (velocity < velocity_threshold) & (dt <= max_gap)
+
+    edges = np.diff(np.concatenate(([0], slow.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)  # Interval run [s, e) covers samples s..e
+    keep = (t[ends] - t[starts]) >= min_duration * 1e6
+    return _build_fixations(t, x, y, starts[keep], ends[keep])
+
+
+def _range_tables(values, levels):
+    """Sparse tables of running maxima and minima: level k holds max/min of values[i:i + 2**k]."""
+    maxima, minima = [values], [values]
+    for level in range(1, levels + 1):
+        half = 1 << (level - 1)
+        previous_max, previous_min = maxima[-1], minima[-1]
+        maxima.append(np.maximum(previous_max[:-half], previous_max[half:]))
+        minima.append(np.minimum(previous_min[:-half], previous_min[half:]))
+    return maxima, minima
+
+
+def _window_dispersion(x, y, starts, stops):
+    """Dispersion of the inclusive windows starts[i]..stops[i], all at once.
+
+    Each window is covered by two (overlapping) power-of-two blocks looked up in
+    sparse tables, so only levels up to the longest window are built.
+    """
+    lengths = stops - starts + 1
+    if not len(lengths):
+        return np.empty(0)
+    levels = np.floor(np.log2(lengths)).astype(np.int64)
+    dispersion = np.empty(len(starts))
+    x_tables, y_tables = _range_tables(x, int(levels.max())), _range_tables(y, int(levels.max()))
+    for level in np.unique(levels).tolist():
+        selected = np.flatnonzero(levels == level)
+        left = starts[selected]
+        right = stops[selected] - (1 << level) + 1
+        total = np.zeros(len(selected))
+        for maxima, minima in (x_tables, y_tables):
+            total += (np.maximum(maxima[level][left], maxima[level][right])
+                      - np.minimum(minima[level][left], minima[level][right]))
+        dispersion[selected] = total
+    return dispersion
+
+
+def _grow_fixations(x, y, starts, limits, dispersion_threshold, chunk=32):
+    """Last sample of the fixation starting at each of starts, all grown at once.
+
+    Every start takes chunk samples (up to its limit) per round; running
+    maxima/minima along the rows find where the dispersion first exceeds the
+    threshold. Fixations still open after a round carry their extremes into the
+    next, twice as long, round.
+    """
+    ends = np.empty(len(starts), dtype=np.int64)
+    offsets = starts.copy()
+    extremes = np.empty((4, len(starts)))  # Running max x, min x, max y, min y
+    extremes[0::2], extremes[1::2] = -np.inf, np.inf
+    active = np.arange(len(starts))
+    while len(active):
+        offset, limit = offsets[active], limits[active]
+        positions = offset[:, None] + np.arange(chunk)
+        inside = positions < limit[:, None]
+        positions = np.minimum(positions, limit[:, None] - 1)
+        xs, ys = x[positions], y[positions]
+        max_x = np.maximum(np.maximum.accumulate(xs, axis=1), extremes[0, active, None])
+        min_x = np.minimum(np.minimum.accumulate(xs, axis=1), extremes[1, active, None])
+        max_y = np.maximum(np.maximum.accumulate(ys, axis=1), extremes[2, active, None])
+        min_y = np.minimum(np.minimum.accumulate(ys, axis=1), extremes[3, active, None])
+        over = ((max_x - min_x) + (max_y - min_y) > dispersion_threshold) & inside
+        exceeded = over.any(axis=1)
+        ends[active[exceeded]] = offset[exceeded] + over[exceeded].argmax(axis=1) - 1
+        at_limit = ~exceeded & (offset + chunk >= limit)
+        ends[active[at_limit]] = limit[at_limit] - 1
+        still_open = ~exceeded & ~at_limit
+        extremes[:, active[still_open]] = np.stack((max_x[still_open, -1], min_x[still_open, -1],
+                                                    max_y[still_open, -1], min_y[still_open, -1]))
+        offsets[active[still_open]] += chunk
+        active = active[still_open]
+        chunk *= 2
+    return ends
+
+
+def detect_fixations_idt(samples, dispersion_threshold=DEFAULT_DISPERSION_THRESHOLD,
+                         min_duration=DEFAULT_MIN_DURATION, max_gap=DEFAULT_MAX_GAP):
+    """Dispersion-threshold (I-DT) fixation detection over a GAZE_DTYPE array.
+
+    A window of at least min_duration seconds whose dispersion
+    (max x - min x) + (max y - min y) stays within dispersion_threshold starts a
+    fixation, which is then grown while the dispersion stays under the threshold.
+
+    Which samples may start a fixation is decided for all of them at once with
+    sparse-table range maxima/minima. Fixations are then grown from the first
+    candidate of every run of candidates together, and again from the sample
+    after each end while that is a candidate, so the number of NumPy passes grows
+    with the longest chain of back-to-back fixations rather than with the
+    number of samples. A final walk in plain Python picks the non-overlapping
+    fixations in order.
+    """
+    t, x, y = _valid_arrays(samples)
+    n = len(t)
+    if not n:
+        return _build_fixations(t, x, y, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    # A fixation starting at i may not extend past the first gap after i
+    gap_intervals = np.flatnonzero(np.diff(t) > max_gap * 1e6)
+    gap = np.searchsorted(gap_intervals, np.arange(n), side='left')
+    limits = np.append(gap_intervals + 1, n)[gap]
+    window_ends = np.searchsorted(t, t + int(min_duration * 1e6), side='left')
+    possible = np.flatnonzero((window_ends < n) & (window_ends < limits))
+    candidates = possible[_window_dispersion(x, y, possible, window_ends[possible]) <= dispersion_threshold]
+    is_candidate = np.zeros(n + 1, dtype=bool)  # One spare slot, so index n (and -1) read False
+    is_candidate[candidates] = True
+
+    grown = np.zeros(n + 1, dtype=bool)
+    fixation_starts, fixation_ends = [], []
+    frontier = candidates[~is_candidate[candidates - 1]]
+    while len(frontier):
+        ends = _grow_fixations(x, y, frontier, limits[frontier], dispersion_threshold)
+        grown[frontier] = True
+        fixation_starts.append(frontier)
+        fixation_ends.append(ends)
+        following = ends + 1
+        frontier = np.unique(following[is_candidate[following] & ~grown[following]])
+
+    starts, ends = [], []
+    if fixation_starts:
+        all_starts, all_ends = np.concatenate(fixation_starts), np.concatenate(fixation_ends)
+        following = np.searchsorted(candidates, all_ends + 1, side='left')
+        chain = dict(zip(all_starts.tolist(), zip(all_ends.tolist(), following.tolist())))
+        candidate_list = candidates.tolist()
+        position = 0
+        while position < len(candidate_list):
+            i = candidate_list[position]
+            if i not in chain:  # A candidate swallowed by an earlier fixation's run, grown on demand
+                end = int(_grow_fixations(x, y, np.array([i]), limits[[i]], dispersion_threshold)[0])
+                chain[i] = (end, int(np.searchsorted(candidates, end + 1, side='left')))
+            end, position = chain[i]
+            starts.append(i)
+            ends.append(end)
+    return _build_fixations(t, x, y, np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64))
+
+
+def saccades_between(fixations):
+    """Saccades as the movements from each fixation to the next."""
+    saccades = np.empty(max(len(fixations) - 1, 0), dtype=SACCADE_DTYPE)
+    if not len(saccades):
+        return saccades
+    before, after = fixations[:-1], fixations[1:]
+    saccades['start'] = before['end']
+    saccades['end'] = after['start']
+    saccades['duration'] = after['start'] - before['end']
+    saccades['start_x'], saccades['start_y'] = before['x'], before['y']
+    saccades['end_x'], saccades['end_y'] = after['x'], after['y']
+    saccades['amplitude'] = np.hypot(after['x'] - before['x'], after['y'] - before['y'])
+    return saccades
+
+
+def detect_fixations(samples, method='ivt', **thresholds):
+    """Run I-VT ('ivt') or I-DT ('idt') detection and return (fixations, saccades)."""
+    if method == 'ivt':
+        fixations = detect_fixations_ivt(samples, **thresholds)
+    elif method == 'idt':
+        fixations = detect_fixations_idt(samples, **thresholds)
+    else:
+        raise ValueError(f"Unknown fixation detection method: {method}")
+    return fixations, saccades_between(fixations)
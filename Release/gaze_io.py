@@ -0,0 +1,182 @@
+# gaze_io.py
+import os, re, sys
+
+import numpy as np
+
+# One record per gaze sample: epoch microseconds, the raw tracker coordinates and
+# whether the tracker reported a finite position. The layout is packed so the same
+# dtype describes the fixed-width records of the binary session files.
+GAZE_DTYPE = np.dtype([('timestamp', '<i8'), ('x', '<f8'), ('y', '<f8'), ('valid', '?')])
+
+# Binary session files (.gzb) sit next to the text logs: a 32-byte header followed
+# by `count` GAZE_DTYPE records.
+BINARY_EXTENSION = '.gzb'
+BINARY_MAGIC = b'GAZEBIN'
+BINARY_VERSION = 1
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'), ('version', '<u2'), ('header_size', '<u2'), ('record_size', '<u2'),
+    ('reserved', '<u2'), ('count', '<u8'), ('padding', 'V8'),
+])
+
+_NUMBER = r'[-+]?(?:\d+\.?\d*|\.\d+|nan|inf)(?:[eE][-+]?\d+)?'
+_GAZE_LINE = re.compile(
+    r'^\[(\d{4}-\d{2}-\d{2}) (\d{2}:\d{2}:\d{2}(?:\.\d{1,6})?)\] Gaze point: '
+    r'\[\s*(' + _NUMBER + r')\s*,\s*(' + _NUMBER + r')\s*\][ \t\r]*$',
+    re.MULTILINE,
+)
+
+
+def parse_gaze_text(text):
+    """Parse the text of a gazeData*.txt file in a single pass.
+
+    Returns a tuple (samples, skipped) where samples is a GAZE_DTYPE array and
+    skipped is the number of non-empty lines that did not match the format or
+    carry an impossible date or time (e.g. hour 99).
+    """
+    matches = _GAZE_LINE.findall(text)
+    total_lines = sum(1 for line in text.splitlines() if line.strip())
+    samples = np.empty(len(matches), dtype=GAZE_DTYPE)
+    if matches:
+        dates, times, xs, ys = zip(*matches)
+        stamps = np.char.add(np.char.add(np.array(dates), 'T'), np.array(times))
+        try:
+            timestamps = stamps.astype('datetime64[us]').astype(np.int64)
+        except ValueError:
+            # Some stamp is out of range; convert one by one and drop the bad lines
+            converted = [_timestamp_or_none(stamp) for stamp in stamps.tolist()]
+            good = np.array([value is not None for value in converted])
+            samples = samples[good]
+            timestamps = np.array([value for value in converted if value is not None], dtype=np.int64)
+            xs, ys = np.array(xs)[good], np.array(ys)[good]
+        samples['timestamp'] = timestamps
+        samples['x'] = np.array(xs).astype(np.float64)
+        samples['y'] = np.array(ys).astype(np.float64)
+        samples['valid'] = np.isfinite(samples['x']) & np.isfinite(samples['y'])
+    return samples, total_lines - len(samples)
+
+
+def _timestamp_or_none(stamp):
+    try:
+        return int(np.datetime64(stamp, 'us').astype(np.int64))
+    except ValueError:
+        return None
+
+
+def binary_path_for(file_path):
+    return os.path.splitext(file_path)[0] + BINARY_EXTENSION
+
+
+def _binary_is_current(file_path, binary_path):
+    if not os.path.exists(binary_path):
+        return False
+    if not os.path.exists(file_path):
+        return True
+    return os.path.getmtime(binary_path) >= os.path.getmtime(file_path)
+
+
+def gaze_file_exists(file_path):
+    """True if a gaze log is available either as text or as its binary twin."""
+    return os.path.exists(file_path) or os.path.exists(binary_path_for(file_path))
+
+
+def write_gaze_binary(samples, binary_path):
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header['magic'] = BINARY_MAGIC
+    header['version'] = BINARY_VERSION
+    header['header_size'] = HEADER_DTYPE.itemsize
+    header['record_size'] = GAZE_DTYPE.itemsize
+    header['count'] = len(samples)
+    with open(binary_path, 'wb') as file:
+        file.write(header.tobytes())
+        file.write(np.ascontiguousarray(samples, dtype=GAZE_DTYPE).tobytes())
+
+
+def read_gaze_binary(binary_path):
+    """Memory-map a binary session file as a read-only GAZE_DTYPE array."""
+    header = np.fromfile(binary_path, dtype=HEADER_DTYPE, count=1)
+    if len(header) != 1 or header['magic'][0] != BINARY_MAGIC:
+        raise ValueError(f"{binary_path} is not a gaze binary file")
+    if header['version'][0] != BINARY_VERSION or header['record_size'][0] != GAZE_DTYPE.itemsize:
+        raise ValueError(f"Unsupported gaze binary version in {binary_path}")
+    count = int(header['count'][0])
+    if count == 0:
+        return np.empty(0, dtype=GAZE_DTYPE)
+    return np.memmap(binary_path, dtype=GAZE_DTYPE, mode='r', offset=int(header['header_size'][0]), shape=(count,))
+
+
+def load_gaze_data(file_path, cache_binary=True):
+    """Read a whole gaze log into a GAZE_DTYPE array, reporting skipped lines.
+
+    The binary twin of file_path is memory-mapped instead whenever it is at least
+    as new as the text log. Otherwise the text is parsed and, with cache_binary,
+    the binary twin is (re)written so the next load is instant.
+    """
+    binary_path = binary_path_for(file_path)
+    if _binary_is_current(file_path, binary_path):
+        try:
+            return read_gaze_binary(binary_path)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable binary gaze file: {e}")
+
+    with open(file_path, 'r') as file:
+        samples, skipped = parse_gaze_text(file.read())
+    if skipped:
+        print(f"Skipped {skipped} malformed line(s) in {file_path}")
+    if cache_binary:
+        try:
+            write_gaze_binary(samples, binary_path)
+        except OSError as e:
+            print(f"Unable to write binary gaze file: {e}")
+    return samples
+
+
+def convert_gaze_file(file_path):
+    """Convert one text gaze log into its binary twin and return the binary path."""
+    with open(file_path, 'r') as file:
+        samples, skipped = parse_gaze_text(file.read())
+    if skipped:
+        print(f"Skipped {skipped} malformed line(s) in {file_path}")
+    binary_path = binary_path_for(file_path)
+    write_gaze_binary(samples, binary_path)
+    return binary_path
+
+
+def convert_session(session_directory):
+    """Convert every gazeData*.txt log of a session directory to the binary format."""
+    converted = []
+    for filename in sorted(os.listdir(session_directory)):
+        if filename.startswith('gazeData') and filename.endswith('.txt'):
+            converted.append(convert_gaze_file(os.path.join(session_directory, filename)))
+    return converted
+
+
+def format_timestamps(timestamps, unit=None):
+    """Format epoch-microsecond timestamps the way the recorder writes them.
+
+    Milliseconds are used unless a sample carries sub-millisecond precision.
+    """
+    stamps = np.asarray(timestamps, dtype=np.int64)
+    if not stamps.size:
+        return np.empty(stamps.shape, dtype='<U26')
+    if unit is None:
+        unit = 'ms' if not np.any(stamps % 1000) else 'us'
+    text = np.datetime_as_string(stamps.astype('datetime64[us]'), unit=unit)
+    return np.char.replace(text, 'T', ' ')
+
+
+def normalize_gaze_array(x, y, screen_width, screen_height):
+    """Map tracker coordinates (-1..1, y up; values beyond are clamped) to screen pixels."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    x_scale = np.maximum(np.abs(x), 1)
+    y_scale = np.maximum(np.abs(y), 1)
+    screen_x = (((x / x_scale) + 1) / 2 * screen_width).astype(np.int64)
+    screen_y = ((1 - (y / y_scale)) / 2 * screen_height).astype(np.int64)
+    return screen_x, screen_y
+
+
+if __name__ == "__main__":
+    # Usage: python gaze_io.py <session_directory> [<session_directory> ...]
+    for directory in sys.argv[1:]:
+        for path in convert_session(directory):
+            print(f"Wrote {path}")
@@ -0,0 +1,100 @@
+# heatmap.py
+import struct, zlib
+
+import numpy as np
+
+
+def default_bin_size(width, height):
+    side = min(width, height)
+    return max(side // max(side // 50, 10), 1)  # About 50 px, at least 10 bins
+
+
+def heatmap_shape(width, height, bin_size):
+    """Number of (rows, columns) of bin_size pixels needed to cover a width x height area."""
+    return max(int(np.ceil(height / bin_size)), 1), max(int(np.ceil(width / bin_size)), 1)
+
+
+def compute_density(xs, ys, width, height, bin_size):
+    """Count screen-space gaze points into a (rows, columns) grid of bin_size pixel bins.
+
+    Bins are fixed to the screen rectangle rather than the data extent, so grids
+    from different batches, sessions or users can be added and compared directly.
+    """
+    rows, columns = heatmap_shape(width, height, bin_size)
+    xs = np.asarray(xs, dtype=np.int64)
+    ys = np.asarray(ys, dtype=np.int64)
+    inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+    cells = (ys[inside] // bin_size) * columns + (xs[inside] // bin_size)
+    return np.bincount(cells, minlength=rows * columns).reshape(rows, columns).astype(np.float64)
+
+
+def smooth_density(grid, sigma):
+    """Separable Gaussian blur of a density grid; sigma is in bins."""
+    if sigma <= 0:
+        return grid
+    radius = max(int(3 * sigma), 1)
+    offsets = np.arange(-radius, radius + 1)
+    kernel = np.exp(-0.5 * (offsets / sigma) ** 2)
+    kernel /= kernel.sum()
+    padded = np.pad(grid, ((radius, radius), (0, 0)))
+    grid = sum(weight * padded[i:i + grid.shape[0]] for i, weight in enumerate(kernel))
+    padded = np.pad(grid, ((0, 0), (radius, radius)))
+    return sum(weight * padded[:, i:i + grid.shape[1]] for i, weight in enumerate(kernel))
+
+
+def density_to_rgba(grid, color=(255, 0, 0)):
+    """Map a density grid to an RGBA uint8 image whose alpha follows the normalized density."""
+    rgba = np.zeros(grid.shape + (4,), dtype=np.uint8)
+    peak = grid.max() if grid.size else 0
+    if peak <= 0:
+        return rgba
+    rgba[..., :3] = color
+    rgba[..., 3] = (255 * (grid / peak)).astype(np.uint8)
+    return rgba
+
+
+def signed_density_to_rgba(grid, positive=(255, 0, 0), negative=(0, 0, 255)):
+    """Map a difference grid to RGBA: positive bins in one color, negative in the other,
+    alpha following the magnitude relative to the largest absolute value."""
+    rgba = np.zeros(grid.shape + (4,), dtype=np.uint8)
+    peak = np.abs(grid).max() if grid.size else 0
+    if peak <= 0:
+        return rgba
+    rgba[grid > 0, :3] = positive
+    rgba[grid < 0, :3] = negative
+    rgba[..., 3] = (255 * (np.abs(grid) / peak)).astype(np.uint8)
+    return rgba
+
+
+def render_heatmap(grid, width, height, bin_size, word_boxes=(), color=(255, 0, 0)):
+    """Full-size RGB uint8 image of a density grid over a white page with the word boxes.
+
+    Offscreen counterpart of HeatmapOverlay for reports; needs no display.
+    """
+    image = np.full((height, width, 3), 255, dtype=np.float64)
+    for x, y, box_width, box_height in np.asarray(word_boxes, dtype=np.int64).reshape(-1, 4):
+        image[max(y, 0):max(y + box_height, 0), max(x, 0):max(x + box_width, 0)] = 234  # Word background as drawn by TextView
+    rgba = density_to_rgba(grid, color)
+    rgba = np.repeat(np.repeat(rgba, bin_size, axis=0), bin_size, axis=1)[:height, :width]
+    alpha = rgba[..., 3:] / 255.0
+    image = image * (1 - alpha) + rgba[..., :3] * alpha
+    return image.astype(np.uint8)
+
+
+def write_png(image, file_path):
+    """Write an (H, W, 3) RGB or (H, W, 4) RGBA uint8 image as PNG using only zlib."""
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    height, width, channels = image.shape
+    color_type = {3: 2, 4: 6}[channels]
+    # Each scanline is prefixed with filter type 0 (none)
+    raw = np.concatenate((np.zeros((height, 1), dtype=np.uint8), image.reshape(height, width * channels)), axis=1)
+
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0)
+    with open(file_path, 'wb') as file:
+        file.write(b'\x89PNG\r\n\x1a\n')
+        file.write(chunk(b'IHDR', header))
+        file.write(chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)))
+        file.write(chunk(b'IEND', b''))
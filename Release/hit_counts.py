@@ -0,0 +1,253 @@
+# hit_counts.py
+import os, re
+
+import numpy as np
+
+from gaze_io import format_timestamps
+
+# Binary hit-count files (.whc) sit next to word_hit_counts.txt: a header, one
+# WORD_DTYPE record per word in reading order, the UTF-8 identifiers back to back
+# (each record holds its identifier's offset and length, so identifiers of any
+# length fit), then every word's hit timestamps back to back as unsigned offsets
+# from base_timestamp in units of time_unit µs. Word records and timestamps are
+# memory-mapped, so one word's hits can be read without touching the rest of the file.
+BINARY_EXTENSION = '.whc'
+BINARY_MAGIC = b'WORDHITS'
+BINARY_VERSION = 2
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'), ('version', '<u2'), ('offset_size', '<u2'), ('time_unit', '<u4'),
+    ('word_count', '<u8'), ('hit_count', '<u8'), ('base_timestamp', '<i8'), ('identifier_bytes', '<u8'),
+])
+WORD_DTYPE = np.dtype([
+    ('identifier_offset', '<u8'), ('identifier_length', '<u4'), ('count', '<u8'), ('offset', '<u8'),
+    ('coord_x', '<i4'), ('coord_y', '<i4'), ('has_coords', '?'),
+])
+
+_TEXT_LINE = re.compile(
+    r'^(?P<identifier>[^:]+): (?P<count>\d+)'
+    r'(?: - Coords: (?P<x>-?\d+), (?P<y>-?\d+))?'
+    r' - Timestamps: ?(?P<timestamps>.*)$'
+)
+
+
+def binary_path_for(file_path):
+    return os.path.splitext(file_path)[0] + BINARY_EXTENSION
+
+
+def _parse_timestamps(timestamps_str):
+    if not timestamps_str.strip():
+        return np.empty(0, dtype=np.int64)
+    stamps = np.char.replace(np.array(timestamps_str.split(', ')), ' ', 'T')
+    return stamps.astype('datetime64[us]').astype(np.int64)
+
+
+def parse_word_hit_text(file_path):
+    """Parse the text format written by write_word_hit_text.
+
+    Returns {identifier: {'count', 'timestamps', 'coords'}} with int64 epoch
+    microsecond timestamps. Lines that do not match the format are skipped.
+    """
+    word_hits = {}
+    skipped = 0
+    with open(file_path, 'r') as file:
+        for line in file:
+            match = _TEXT_LINE.match(line.rstrip('\n'))
+            if not match:
+                skipped += bool(line.strip())
+                continue
+            coords = (int(match['x']), int(match['y'])) if match['x'] is not None else None
+            word_hits[match['identifier']] = {
+                'count': int(match['count']),
+                'timestamps': _parse_timestamps(match['timestamps']),
+                'coords': coords,
+            }
+    if skipped:
+        print(f"Skipped {skipped} malformed line(s) in {file_path}")
+    return word_hits
+
+
+def write_word_hit_text(word_hits, file_path):
+    lines = []
+    for key, data in word_hits.items():
+        coords_str = f" - Coords: {data['coords'][0]}, {data['coords'][1]}" if data['coords'] else ""
+        timestamps_str = ', '.join(format_timestamps(data['timestamps'], unit='us').tolist())
+        lines.append(f"{key}: {data['count']}{coords_str} - Timestamps: {timestamps_str}\n")
+    with open(file_path, 'w') as file:
+        file.write(''.join(lines))
+
+
+def write_word_hit_binary(word_hits, binary_path):
+    words = np.zeros(len(word_hits), dtype=WORD_DTYPE)
+    timestamps = [np.asarray(data['timestamps'], dtype=np.int64) for data in word_hits.values()]
+    all_timestamps = np.concatenate(timestamps) if timestamps else np.empty(0, dtype=np.int64)
+    counts = np.array([len(stamps) for stamps in timestamps], dtype=np.uint64)
+
+    encoded = [identifier.encode('utf-8') for identifier in word_hits.keys()]
+    lengths = np.array([len(identifier) for identifier in encoded], dtype=np.uint64)
+    words['identifier_length'] = lengths
+    words['identifier_offset'] = np.concatenate(([0], np.cumsum(lengths)[:-1])) if len(lengths) else lengths
+    words['count'] = counts
+    words['offset'] = np.concatenate(([0], np.cumsum(counts)[:-1])) if len(counts) else counts
+    for index, data in enumerate(word_hits.values()):
+        if data['coords']:
+            words['coord_x'][index], words['coord_y'][index] = data['coords']
+            words['has_coords'][index] = True
+
+    base = int(all_timestamps.min()) if len(all_timestamps) else 0
+    relative = all_timestamps - base
+    time_unit = 1000 if not np.any(relative % 1000) else 1
+    relative //= time_unit
+    offset_dtype = '<u4' if not len(relative) or relative.max() < 2 ** 32 else '<u8'
+
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header['magic'] = BINARY_MAGIC
+    header['version'] = BINARY_VERSION
+    header['offset_size'] = np.dtype(offset_dtype).itemsize
+    header['time_unit'] = time_unit
+    header['word_count'] = len(words)
+    header['hit_count'] = len(all_timestamps)
+    header['base_timestamp'] = base
+    identifier_blob = b''.join(encoded)
+    header['identifier_bytes'] = len(identifier_blob)
+    with open(binary_path, 'wb') as file:
+        file.write(header.tobytes())
+        file.write(words.tobytes())
+        file.write(identifier_blob)
+        file.write(relative.astype(offset_dtype).tobytes())
+
+
+def write_word_hits(word_hits, file_path):
+    """Write word_hit_counts.txt and its compact binary twin."""
+    write_word_hit_text(word_hits, file_path)
+    write_word_hit_binary(word_hits, binary_path_for(file_path))
+
+
+class WordHitTable:
+    """ Lazily loaded view of a binary hit-count file.
+
+    Only the header is read up front; the word table and the timestamp offsets
+    are memory-mapped, so hits(word) reads just that word's slice.
+    """
+    def __init__(self, binary_path):
+        header = np.fromfile(binary_path, dtype=HEADER_DTYPE, count=1)
+        if len(header) != 1 or header['magic'][0] != BINARY_MAGIC:
+            raise ValueError(f"{binary_path} is not a word hit file")
+        if header['version'][0] != BINARY_VERSION:
+            raise ValueError(f"Unsupported word hit file version in {binary_path}")
+        self.path = binary_path
+        self.base_timestamp = int(header['base_timestamp'][0])
+        self.time_unit = int(header['time_unit'][0])
+        self.word_count = int(header['word_count'][0])
+        self.hit_count = int(header['hit_count'][0])
+        self._offset_dtype = '<u4' if header['offset_size'][0] == 4 else '<u8'
+        self._words_offset = HEADER_DTYPE.itemsize
+        self._identifiers_offset = self._words_offset + self.word_count * WORD_DTYPE.itemsize
+        self._identifier_bytes = int(header['identifier_bytes'][0])
+        self._hits_offset = self._identifiers_offset + self._identifier_bytes
+        self._words = None
+        self._identifiers = None
+        self._hits = None
+        self._index_by_identifier = None
+
+    def __len__(self):
+        return self.word_count
+
+    @property
+    def words(self):
+        if self._words is None:
+            if self.word_count:
+                self._words = np.memmap(self.path, dtype=WORD_DTYPE, mode='r', offset=self._words_offset, shape=(self.word_count,))
+            else:
+                self._words = np.empty(0, dtype=WORD_DTYPE)
+        return self._words
+
+    @property
+    def identifiers(self):
+        if self._identifiers is None:
+            with open(self.path, 'rb') as file:
+                file.seek(self._identifiers_offset)
+                blob = file.read(self._identifier_bytes)
+            words = self.words
+            self._identifiers = np.array([blob[offset:offset + length].decode('utf-8') for offset, length in
+                                          zip(words['identifier_offset'].tolist(), words['identifier_length'].tolist())], dtype=str)
+        return self._identifiers
+
+    @property
+    def counts(self):
+        return self.words['count']
+
+    def index_of(self, identifier):
+        if self._index_by_identifier is None:
+            self._index_by_identifier = {identifier: index for index, identifier in enumerate(self.identifiers.tolist())}
+        return self._index_by_identifier[identifier]
+
+    def hits(self, word):
+        """Epoch-microsecond timestamps of one word, by index or identifier."""
+        index = self.index_of(word) if isinstance(word, str) else int(word)
+        record = self.words[index]
+        if not record['count']:
+            return np.empty(0, dtype=np.int64)
+        if self._hits is None:
+            self._hits = np.memmap(self.path, dtype=self._offset_dtype, mode='r', offset=self._hits_offset, shape=(self.hit_count,))
+        offsets = self._hits[int(record['offset']):int(record['offset']) + int(record['count'])]
+        return self.base_timestamp + offsets.astype(np.int64) * self.time_unit
+
+    def coords(self, word):
+        index = self.index_of(word) if isinstance(word, str) else int(word)
+        record = self.words[index]
+        return (int(record['coord_x']), int(record['coord_y'])) if record['has_coords'] else None
+
+    def to_dict(self):
+        return {identifier: {'count': int(self.counts[index]), 'timestamps': self.hits(index), 'coords': self.coords(index)}
+                for index, identifier in enumerate(self.identifiers.tolist())}
+
+
+class ParsedWordHits:
+    """ In-memory stand-in for a WordHitTable, for hit counts parsed from text
+    whose binary twin could not be written. """
+    def __init__(self, word_hits):
+        self._timestamps = [np.asarray(data['timestamps'], dtype=np.int64) for data in word_hits.values()]
+        self._coords = [data['coords'] for data in word_hits.values()]
+        self.identifiers = np.array(list(word_hits.keys()), dtype=str)
+        self.counts = np.array([len(stamps) for stamps in self._timestamps], dtype=np.uint64)
+        self.word_count = len(word_hits)
+        self.hit_count = int(self.counts.sum())
+        self._index_by_identifier = {identifier: index for index, identifier in enumerate(word_hits.keys())}
+
+    def __len__(self):
+        return self.word_count
+
+    def index_of(self, identifier):
+        return self._index_by_identifier[identifier]
+
+    def hits(self, word):
+        return self._timestamps[self.index_of(word) if isinstance(word, str) else int(word)]
+
+    def coords(self, word):
+        return self._coords[self.index_of(word) if isinstance(word, str) else int(word)]
+
+    def to_dict(self):
+        return {identifier: {'count': int(self.counts[index]), 'timestamps': self.hits(index), 'coords': self.coords(index)}
+                for index, identifier in enumerate(self.identifiers.tolist())}
+
+
+def load_word_hits(file_path):
+    """Open the hit counts of a session as a WordHitTable.
+
+    The binary twin of file_path is used when it is at least as new as the text
+    file; otherwise the text is parsed once and the binary twin written. If that
+    write fails the parsed hits are returned as a ParsedWordHits instead.
+    """
+    binary_path = binary_path_for(file_path)
+    if os.path.exists(binary_path) and (not os.path.exists(file_path) or os.path.getmtime(binary_path) >= os.path.getmtime(file_path)):
+        try:
+            return WordHitTable(binary_path)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable word hit file: {e}")
+    word_hits = parse_word_hit_text(file_path)
+    try:
+        write_word_hit_binary(word_hits, binary_path)
+        return WordHitTable(binary_path)
+    except OSError as e:
+        print(f"Unable to write binary word hit file: {e}")
+        return ParsedWordHits(word_hits)
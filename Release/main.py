@@ -1,20 +1,53 @@
 # main.py
+import sys, time
 from PyQt5.QtWidgets import QApplication
-import sys
-from ui_components import GazeVisualizer
+from PyQt5.QtCore import QTimer
+
+HEAVY_MODULES = ('sklearn', 'joblib', 'matplotlib', 'scipy')  # Should stay unloaded until Calibrate/Analyze/Heatmap
 
 def main():
+    profile = '--profile-startup' in sys.argv
+    if profile:
+        sys.argv.remove('--profile-startup')
+    started = time.perf_counter()
+    timings = []
+
+    def mark(stage):
+        timings.append((stage, time.perf_counter()))
+
     app = QApplication(sys.argv)
+    mark('QApplication')
+    modules_before = set(sys.modules)
+    from ui_components import GazeVisualizer
+    mark('import ui_components')
+    imported = set(sys.modules) - modules_before
     screen = app.primaryScreen()
     main_window = GazeVisualizer(screen.size().width(), screen.size().height())
+    mark('GazeVisualizer()')
     main_window.showFullScreen()
+    mark('showFullScreen()')
+
+    if profile:
+        def report():
+            mark('first event loop pass')
+            print("Startup profile:")
+            previous = started
+            for stage, moment in timings:
+                print(f"  {stage:<24} {(moment - previous) * 1000:8.1f} ms")
+                previous = moment
+            print(f"  {'time to first window':<24} {(previous - started) * 1000:8.1f} ms")
+            print(f"  {len(imported)} modules imported by ui_components")
+            loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+            print(f"  heavy modules loaded at startup: {', '.join(loaded) if loaded else 'none'}")
+            print("  (run with python -X importtime for a per-module breakdown)")
+        QTimer.singleShot(0, report)
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
     main()
 
 #user verileri icin tree veri yapisi; hit countlar da userda tutulsun
-#saat tarih şeklinde recording session     
+#saat tarih şeklinde recording session
 #metni büyütme daha yukarı ve aşağı genisleme   TMM
 #toggle buttons
-#installer
\ No newline at end of file
+#installer
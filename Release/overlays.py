@@ -1,10 +1,15 @@
 # overlays.py
-from PyQt5.QtWidgets import QWidget
-from PyQt5.QtGui import QPainter, QColor, QFont
-from PyQt5.QtCore import Qt, QRect
+import time
+
+from PyQt5.QtWidgets import QWidget, QApplication
+from PyQt5.QtGui import QPainter, QColor, QFont, QImage, QPixmap, QRegion
+from PyQt5.QtCore import Qt, QRect, QTimer
 
 import numpy as np
 
+from gaze_io import normalize_gaze_array
+from heatmap import default_bin_size, compute_density, smooth_density, density_to_rgba, signed_density_to_rgba, heatmap_shape
+
 class Overlay(QWidget):
     """ Basic overlay that can be transparent to mouse events and other interactions. """
     def __init__(self, parent=None):
@@ -17,56 +22,221 @@ class Overlay(QWidget):
         self.setAttribute(Qt.WA_TranslucentBackground)
 
 class HeatmapOverlay(Overlay):
-    """ Displays a heatmap based on gaze points. """
-    def __init__(self, gaze_points, word_hit_data, parent=None):
+    """ Displays a heatmap based on gaze points.
+
+    The density grid and its colormapped QImage are cached and only rebuilt when
+    the points, bin size, smoothing or widget size change; paintEvent draws the
+    cached image with a single drawImage call. set_density swaps in another
+    precomputed grid (e.g. another session or a difference map) without re-binning.
+    """
+    def __init__(self, gaze_points, word_hit_data, parent=None, bin_size=None, smoothing=0.0, density=None):
         super().__init__(parent)
-        self.gaze_points = gaze_points
+        self._point_chunks = [np.asarray(gaze_points, dtype=np.int64).reshape(-1, 2)]
         self.word_hit_data = word_hit_data
-        self.bins = max(min(parent.width(), parent.height()) // 50, 10)
+        self.bin_size = bin_size or self.default_bin_size(parent.width(), parent.height())
+        self.smoothing = smoothing
+        # A precomputed grid (e.g. from the session cache) must match the overlay's size and bin_size
+        self._density = None if density is None else np.array(density, dtype=np.float64)
+        # A grid passed along with gaze_points is their cached binning and can be rebuilt from them;
+        # one without points (set_density, comparison views) cannot
+        self._external_density = density is not None and not len(self.gaze_points)
+        self._image = None
+        self.signed = False  # Diverging colors for difference grids
+        self.title = "Test Timestamp"
+
+    @staticmethod
+    def default_bin_size(width, height):
+        return default_bin_size(width, height)
+
+    @property
+    def gaze_points(self):
+        # Points added during playback are joined only when a full re-binning needs them
+        if len(self._point_chunks) > 1:
+            self._point_chunks = [np.concatenate(self._point_chunks)]
+        return self._point_chunks[0]
+
+    def set_points(self, gaze_points):
+        self._point_chunks = [np.asarray(gaze_points, dtype=np.int64).reshape(-1, 2)]
+        self._density = None
+        self._external_density = False
+        self.update()
+
+    def add_points(self, gaze_points):
+        """Add new samples to the cached histogram without re-binning the old ones."""
+        new_points = np.asarray(gaze_points, dtype=np.int64).reshape(-1, 2)
+        self._point_chunks.append(new_points)
+        if self._density is not None:
+            self._density += compute_density(new_points[:, 0], new_points[:, 1], self.width(), self.height(), self.bin_size)
+            self._image = None
+        self.update()
+
+    def set_density(self, density, signed=False, title=None):
+        """Show a precomputed grid of this overlay's size and bin_size."""
+        self._density = np.asarray(density, dtype=np.float64)
+        self._external_density = True
+        self.signed = signed
+        if title is not None:
+            self.title = title
+        self._image = None
+        self.update()
+
+    def set_bin_size(self, bin_size):
+        if self._external_density:
+            print("A supplied heatmap grid cannot be re-binned; compute it for the new bin size instead.")
+            return
+        self.bin_size = max(int(bin_size), 1)
+        self._density = None
+        self.update()
+
+    def set_smoothing(self, sigma):
+        self.smoothing = max(float(sigma), 0.0)
+        self._image = None
+        self.update()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        # A grid binned from gaze_points is rebuilt for the new size; a supplied grid is
+        # kept and still drawn over the area it was computed for
+        if (self._density is not None and not self._external_density
+                and self._density.shape != heatmap_shape(self.width(), self.height(), self.bin_size)):
+            self._density = None
+
+    def _heatmap_image(self):
+        if self._density is None:
+            self._density = compute_density(self.gaze_points[:, 0], self.gaze_points[:, 1], self.width(), self.height(), self.bin_size)
+            self._image = None
+        if self._image is None:
+            smoothed = smooth_density(self._density, self.smoothing)
+            rgba = signed_density_to_rgba(smoothed) if self.signed else density_to_rgba(smoothed)
+            rows, columns = rgba.shape[:2]
+            self._image = QImage(rgba.tobytes(), columns, rows, 4 * columns, QImage.Format_RGBA8888).copy()
+        return self._image
 
     def paintEvent(self, event):
         qp = QPainter(self)
-        qp.setRenderHint(QPainter.Antialiasing)
-        gaze_points_xy = [(point[0], point[1]) for point in self.gaze_points]
-        heatmap, xedges, yedges = np.histogram2d(*zip(*gaze_points_xy), bins=(self.bins, self.bins))
-        heatmap /= np.max(heatmap)
-
-        for i in range(len(xedges)-1):
-            for j in range(len(yedges)-1):
-                intensity = heatmap[i, j]
-                color = QColor(255, 0, 0, int(255 * intensity))
-                qp.setBrush(color)
-                qp.setPen(Qt.NoPen)
-                qp.drawRect(QRect(int(xedges[i]), int(yedges[j]), int(xedges[i+1] - xedges[i]), int(yedges[j+1] - yedges[j])))
+        image = self._heatmap_image()
+        # Each image pixel is one bin; scale it up to the bin_size grid it came from
+        rows, columns = image.height(), image.width()
+        qp.drawImage(QRect(0, 0, columns * self.bin_size, rows * self.bin_size), image)
 
         qp.setPen(QColor(0, 0, 0))
         font = QFont('Arial', 10)
         qp.setFont(font)
-        qp.drawText(10, 20, "Test Timestamp")
+        qp.drawText(10, 20, self.title)
 
 class GazeOverlay(Overlay):
-    """ Displays an overlay of the current gaze position. """
-    def __init__(self, parent=None):
+    """ Displays an overlay of the current gaze position.
+
+    Positions arriving faster than the display refresh rate are coalesced into
+    one repaint per frame, and each repaint only invalidates the old and new
+    cursor rectangles (plus the trail, if enabled). The cursor is drawn from a
+    cached sprite pixmap. The trail is read from the shared gaze buffer, so it
+    shows the same samples whether they come from recording or playback.
+    """
+    CURSOR_COLOR = QColor(255, 165, 0, 128)
+    TRAIL_DURATION = 0.5  # Seconds a trail point takes to fade out when the trail is on
+    MAX_TRAIL_POINTS = 30  # Dense windows (120 Hz, fast playback) are thinned out in the trail
+
+    def __init__(self, parent=None, trail_duration=0.0, buffer=None):
         super().__init__(parent)
         self.gaze_x, self.gaze_y = 0, 0
+        self.buffer = buffer  # GazeRingBuffer the trail is read from; no trail without one
+        self.trail_duration = trail_duration
+        self._trail = []  # (x, y, opacity) of the trail points of the current frame
+        self._newest_at = 0.0  # Monotonic time the newest buffered sample was presented
+        self._pending = None
+        self._sprite = None
+        self._painted = QRegion()  # Area covered by the last frame
+        self._last_frame = 0.0
+        screen = QApplication.primaryScreen()
+        refresh_rate = screen.refreshRate() if screen else 0
+        self.frame_interval = 1.0 / refresh_rate if refresh_rate > 0 else 1.0 / 60
+        self._frame_timer = QTimer(self)
+        self._frame_timer.setSingleShot(True)
+        self._frame_timer.timeout.connect(self._present)
         self.update_base_circle_radius()
 
     def update_base_circle_radius(self):
-        self.base_circle_radius = min(self.parent().width(), self.parent().height()) * 0.03
+        radius = min(self.parent().width(), self.parent().height()) * 0.03
+        if self._sprite is None or radius != self.base_circle_radius:
+            self.base_circle_radius = radius
+            diameter = int(2 * radius)
+            self._sprite = QPixmap(diameter + 2, diameter + 2)  # One pixel margin for antialiasing
+            self._sprite.fill(Qt.transparent)
+            qp = QPainter(self._sprite)
+            qp.setRenderHint(QPainter.Antialiasing)
+            qp.setBrush(self.CURSOR_COLOR)
+            qp.setPen(Qt.NoPen)
+            qp.drawEllipse(1, 1, diameter, diameter)
+            qp.end()
+
+    def _cursor_rect(self, x, y):
+        return QRect(int(x - self.base_circle_radius) - 1, int(y - self.base_circle_radius) - 1,
+                     self._sprite.width(), self._sprite.height())
+
+    def set_trail(self, duration):
+        """Show a trail of the last duration seconds of gaze positions; 0 turns it off."""
+        self.trail_duration = duration
+        self._present()
+
+    def update_gaze_position(self, x, y):
+        self.update_gaze_positions((x,), (y,))
+
+    def update_gaze_positions(self, xs, ys):
+        """Take a batch of screen positions in time order; the cursor moves to the last one."""
+        if not len(xs):
+            return
+        self._pending = (int(xs[-1]), int(ys[-1]))
+        if not self._frame_timer.isActive():
+            wait = self.frame_interval - (time.monotonic() - self._last_frame)
+            self._frame_timer.start(max(int(wait * 1000), 0))
+
+    def _present(self):
+        now = time.monotonic()
+        self._last_frame = now
+        if self._pending is not None:
+            self.gaze_x, self.gaze_y = self._pending
+            self._pending = None
+            self._newest_at = now
+        self._trail = self._trail_points(now - self._newest_at)
+
+        self.update_base_circle_radius()
+        region = QRegion(self._cursor_rect(self.gaze_x, self.gaze_y))
+        for x, y, _ in self._trail:
+            region = region.united(self._cursor_rect(x, y))
+        self.update(region.united(self._painted))
+        self._painted = region
+        if self._trail:
+            self._frame_timer.start(int(self.frame_interval * 1000))  # Keep fading the trail out
+
+    def _trail_points(self, idle):
+        """(x, y, opacity) of the buffered samples of the last trail_duration seconds.
+
+        A sample's age is its distance to the newest sample in gaze time plus the
+        time since that sample was presented, so the trail also fades when no new
+        samples arrive.
+        """
+        remaining = self.trail_duration - idle
+        if self.buffer is None or remaining <= 0:
+            return []
+        samples = self.buffer.snapshot(remaining)
+        samples = samples[samples['valid']]
+        if not len(samples):
+            return []
+        samples = samples[::-max(-(-len(samples) // self.MAX_TRAIL_POINTS), 1)][::-1]  # Thin out, keeping the newest
+        ages = (samples['timestamp'][-1] - samples['timestamp']) / 1e6 + idle
+        xs, ys = normalize_gaze_array(samples['x'], samples['y'], self.parent().width(), self.parent().height())
+        opacities = np.clip(1.0 - ages / self.trail_duration, 0.0, 1.0) * 0.5
+        return list(zip(xs.tolist(), ys.tolist(), opacities.tolist()))
 
     def paintEvent(self, event):
         self.update_base_circle_radius()
         qp = QPainter(self)
-        qp.setRenderHint(QPainter.Antialiasing)
-        qp.setBrush(QColor(255, 165, 0, 128))
-        qp.setPen(Qt.NoPen)
-        x = int(self.gaze_x - self.base_circle_radius)
-        y = int(self.gaze_y - self.base_circle_radius)
-        diameter = int(2 * self.base_circle_radius)
-        qp.drawEllipse(x, y, diameter, diameter)
-
-    def update_gaze_position(self, x, y):
-        self.gaze_x, self.gaze_y = x, y
-        self.update()
+        if self._trail:
+            for x, y, opacity in self._trail:
+                qp.setOpacity(opacity)
+                qp.drawPixmap(self._cursor_rect(x, y).topLeft(), self._sprite)
+            qp.setOpacity(1.0)
+        qp.drawPixmap(self._cursor_rect(self.gaze_x, self.gaze_y).topLeft(), self._sprite)
 
 #hit count format: typesetting, 2, (2024-03-02 16:39:30, 2024-03-02 16:40:30)
\ No newline at end of file
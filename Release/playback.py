@@ -0,0 +1,92 @@
+# playback.py
+import threading, time
+
+import numpy as np
+
+
+class PlaybackClock:
+    """ Maps monotonic wall time onto recorded sample timestamps.
+
+    Playback position is kept in recording time (epoch microseconds) and advances
+    with time.monotonic() scaled by the speed multiplier, so samples are replayed
+    at their recorded spacing regardless of how long each emit takes. All methods
+    are safe to call from the UI thread while a worker thread reads the clock.
+    """
+    MIN_SPEED = 0.25
+    MAX_SPEED = 16.0
+
+    def __init__(self, timestamps, speed=1.0, clock=time.monotonic):
+        self.timestamps = np.asarray(timestamps, dtype=np.int64)
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._speed = self._clamp_speed(speed)
+        self._start = int(self.timestamps[0]) if len(self.timestamps) else 0
+        self._end = int(self.timestamps[-1]) if len(self.timestamps) else 0
+        self._anchor_position = self._start
+        self._anchor_time = self.clock()
+        self._paused = False
+
+    def _clamp_speed(self, speed):
+        return min(max(float(speed), self.MIN_SPEED), self.MAX_SPEED)
+
+    def _position_locked(self):
+        if self._paused:
+            return self._anchor_position
+        elapsed = (self.clock() - self._anchor_time) * 1e6 * self._speed
+        return min(self._anchor_position + int(elapsed), self._end)
+
+    def _reanchor_locked(self, position):
+        self._anchor_position = min(max(int(position), self._start), self._end)
+        self._anchor_time = self.clock()
+
+    @property
+    def speed(self):
+        return self._speed
+
+    @property
+    def paused(self):
+        return self._paused
+
+    def position(self):
+        """Current playback position in epoch microseconds."""
+        with self._lock:
+            return self._position_locked()
+
+    def set_speed(self, speed):
+        with self._lock:
+            self._reanchor_locked(self._position_locked())
+            self._speed = self._clamp_speed(speed)
+        return self._speed
+
+    def seek(self, timestamp):
+        with self._lock:
+            self._reanchor_locked(timestamp)
+
+    def seek_relative(self, seconds):
+        with self._lock:
+            self._reanchor_locked(self._position_locked() + int(seconds * 1e6))
+
+    def pause(self):
+        with self._lock:
+            self._reanchor_locked(self._position_locked())
+            self._paused = True
+
+    def resume(self):
+        with self._lock:
+            self._anchor_time = self.clock()
+            self._paused = False
+
+    def current_index(self):
+        """Index of the latest sample that is due, or -1 before the first one."""
+        return int(np.searchsorted(self.timestamps, self.position(), side='right')) - 1
+
+    def seconds_until(self, index):
+        """Wall-clock seconds until sample index is due (0 if already due)."""
+        if index >= len(self.timestamps):
+            return 0.0
+        with self._lock:
+            remaining = int(self.timestamps[index]) - self._position_locked()
+            return max(remaining / 1e6 / self._speed, 0.0)
+
+    def at_end(self):
+        return self.position() >= self._end
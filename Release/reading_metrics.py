@@ -0,0 +1,85 @@
+# reading_metrics.py
+import numpy as np
+
+from gaze_io import normalize_gaze_array
+from word_index import WordIndex
+
+METRICS_FILENAME = 'reading_metrics.npy'
+
+# One row per word of the setupLabels layout, in reading order. Durations are in
+# microseconds; a word is skipped when first-pass reading moved past it without
+# fixating it (words after the furthest word reached are not counted as skipped).
+# The string widths are minimums; metrics_dtype widens them to fit a text.
+METRICS_DTYPE = np.dtype([
+    ('word_index', np.int32), ('identifier', 'U32'), ('word', 'U48'),
+    ('fixation_count', np.int32),
+    ('first_fixation_duration', np.int64),
+    ('gaze_duration', np.int64),
+    ('total_reading_time', np.int64),
+    ('skipped', np.bool_),
+    ('regressions_in', np.int32),
+    ('regressions_out', np.int32),
+])
+
+
+def metrics_dtype(identifiers, words):
+    """METRICS_DTYPE with identifier and word wide enough for the given strings, so none is truncated."""
+    longest = {'identifier': max(map(len, identifiers), default=0), 'word': max(map(len, words), default=0)}
+    return np.dtype([(name, f"U{max(METRICS_DTYPE[name].itemsize // 4, longest[name])}") if name in longest else (name, METRICS_DTYPE[name])
+                     for name in METRICS_DTYPE.names])
+
+
+def fixation_word_ids(fixations, word_boxes, screen_width, screen_height):
+    """Word index under each fixation centroid, -1 for fixations off the text."""
+    screen_xs, screen_ys = normalize_gaze_array(fixations['x'], fixations['y'], screen_width, screen_height)
+    return WordIndex(word_boxes).lookup_many(screen_xs, screen_ys)
+
+
+def compute_reading_metrics(fixations, word_boxes, identifiers, words, screen_width, screen_height):
+    """Per-word reading measures for one session from FIXATION_DTYPE records."""
+    word_count = len(identifiers)
+    metrics = np.zeros(word_count, dtype=metrics_dtype(identifiers, words))
+    metrics['word_index'] = np.arange(word_count)
+    metrics['identifier'] = identifiers
+    metrics['word'] = words
+    if not len(fixations) or not word_count:
+        return metrics
+
+    ids = fixation_word_ids(fixations, word_boxes, screen_width, screen_height)
+    durations = fixations['duration']
+    on_text = ids >= 0
+    metrics['fixation_count'] = np.bincount(ids[on_text], minlength=word_count)
+    metrics['total_reading_time'] = np.bincount(ids[on_text], weights=durations[on_text], minlength=word_count).astype(np.int64)
+
+    # Runs of consecutive fixations on the same word (or off the text)
+    run_starts = np.flatnonzero(np.concatenate(([True], ids[1:] != ids[:-1])))
+    run_words = ids[run_starts]
+    run_durations = np.add.reduceat(durations, run_starts)
+
+    # First pass: the run lands on a word further right than any word fixated before it
+    furthest_before = np.concatenate(([-1], np.maximum.accumulate(run_words)[:-1]))
+    first_pass = (run_words >= 0) & (run_words > furthest_before)
+    first_pass_words = run_words[first_pass]
+    metrics['first_fixation_duration'][first_pass_words] = durations[run_starts[first_pass]]
+    metrics['gaze_duration'][first_pass_words] = run_durations[first_pass]
+
+    read_in_first_pass = np.zeros(word_count, dtype=bool)
+    read_in_first_pass[first_pass_words] = True
+    furthest = run_words.max()
+    metrics['skipped'] = ~read_in_first_pass & (np.arange(word_count) < furthest)
+
+    # Regressions: moves from a word to an earlier word, ignoring off-text runs
+    word_runs = run_words[run_words >= 0]
+    backwards = word_runs[1:] < word_runs[:-1]
+    metrics['regressions_in'] = np.bincount(word_runs[1:][backwards], minlength=word_count)
+    metrics['regressions_out'] = np.bincount(word_runs[:-1][backwards], minlength=word_count)
+    return metrics
+
+
+def save_reading_metrics(metrics, file_path):
+    np.save(file_path, metrics)
+
+
+def load_reading_metrics(file_path):
+    """Memory-map a saved metrics table."""
+    return np.load(file_path, mmap_mode='r')
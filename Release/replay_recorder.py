@@ -0,0 +1,45 @@
+# replay_recorder.py
+"""Stand-in for cpp_exec/Tobii_api_test1 that replays an existing gaze log.
+
+Takes the same arguments as the recorder (window id and output file) and
+appends the lines of --source to the output file at their recorded pace, so
+live streaming can be exercised without the Windows binary or a tracker:
+
+    GAZE_RECORDER="python replay_recorder.py --source data/<user>_data/<session>/gazeData.txt"
+"""
+import argparse, sys, time
+
+from gaze_io import load_gaze_data, format_timestamps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded gaze log as if it were a live recording.")
+    parser.add_argument('window_id')
+    parser.add_argument('output_file')
+    parser.add_argument('--source', required=True, help="gazeData*.txt or .gzb file to replay")
+    parser.add_argument('--speed', type=float, default=1.0, help="Playback speed multiplier")
+    parser.add_argument('--loop', action='store_true', help="Start over when the source is exhausted")
+    args = parser.parse_args()
+
+    samples = load_gaze_data(args.source, cache_binary=False)
+    if not len(samples):
+        print(f"No gaze samples in {args.source}", file=sys.stderr)
+        return 1
+    lines = [f"[{ts}] Gaze point: [{x}, {y}]\n" for ts, x, y in zip(format_timestamps(samples['timestamp']).tolist(), samples['x'].tolist(), samples['y'].tolist())]
+    offsets = (samples['timestamp'] - samples['timestamp'][0]) / 1e6 / args.speed
+
+    with open(args.output_file, 'a') as output:
+        while True:
+            start = time.monotonic()
+            for line, offset in zip(lines, offsets.tolist()):
+                delay = start + offset - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                output.write(line)
+                output.flush()
+            if not args.loop:
+                return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+# report.py
+"""Headless report generation: python report.py <session, user or data folder>... [--output DIR]
+
+Runs the whole pipeline without a display for every session found, in
+parallel across CPU cores, and writes one report folder per session.
+"""
+import argparse, csv, json, os, sys, time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from config import app_config
+from gaze_io import load_gaze_data, gaze_file_exists, normalize_gaze_array
+from calibration_model import load_calibration
+from analysis import run_word_analysis
+from aggregation import gaze_summary, reading_summary, list_sessions
+from hit_counts import write_word_hit_text
+from heatmap import default_bin_size, compute_density, smooth_density, render_heatmap, write_png
+from session_cache import SessionCache
+from text_layout import load_session_layout
+
+DEFAULT_SCREEN_SIZE = (1920, 1080)
+HEATMAP_SMOOTHING = 1.0  # Bins
+_qt_app = None  # Offscreen QGuiApplication of a worker, only created when a layout has to be computed
+
+
+def find_sessions(path):
+    """Session directories under path: a session itself, a user's _data folder or the data root."""
+    path = os.path.abspath(path)
+    if gaze_file_exists(os.path.join(path, 'gazeData.txt')) or gaze_file_exists(os.path.join(path, 'gazeData_calibrated.txt')):
+        return [path]
+    if not os.path.isdir(path):
+        return []
+    return [session for directory in list_sessions(path) for session in find_sessions(directory)]
+
+
+def calibrate(session_directory):
+    """Make sure gazeData_calibrated.txt is current; returns the calibration model or None.
+
+    A model is fitted from the gazeData_<dot>.txt files when the session has
+    none yet, and the raw recording is recalibrated when it is newer than the
+    calibrated one.
+    """
+    from calibration import fit_session_calibration, calibrate_session
+    model = load_calibration(session_directory)
+    if model is None and gaze_file_exists(os.path.join(session_directory, 'gazeData_0.txt')):
+        fit = fit_session_calibration(session_directory)
+        model = fit.model if fit else None
+    raw_path = os.path.join(session_directory, 'gazeData.txt')
+    calibrated_path = os.path.join(session_directory, 'gazeData_calibrated.txt')
+    if model is not None and os.path.exists(raw_path):
+        if not os.path.exists(calibrated_path) or os.path.getmtime(calibrated_path) < os.path.getmtime(raw_path):
+            calibrate_session(session_directory, model)
+    return model
+
+
+def offscreen_layout(session_directory, screen_width, screen_height):
+    """Lay the session's text out with an offscreen Qt platform (no display needed).
+
+    Only used for sessions without a saved layout; fonts on this machine may
+    differ from the ones the session was recorded with.
+    """
+    global _qt_app
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtGui import QGuiApplication, QFont
+    from text_view import cached_layout
+    from ui_styles import get_label_style, get_text_content
+    if QGuiApplication.instance() is None:
+        _qt_app = QGuiApplication(['report'])
+    font_family, font_size, line_spacing_factor = get_label_style(screen_height)
+    dpi = QGuiApplication.primaryScreen().logicalDotsPerInchX()
+    return cached_layout(get_text_content(session_directory), QFont(font_family, font_size),
+                         screen_width, screen_height, line_spacing_factor, dpi)
+
+
+def _write_table(array, file_path):
+    with open(file_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(array.dtype.names)
+        writer.writerows(array.tolist())
+
+
+def report_session(session_directory, output_directory, screen_size=DEFAULT_SCREEN_SIZE):
+    """Run the full pipeline for one session and write its report folder; returns the summary."""
+    started = time.perf_counter()
+    user = os.path.basename(os.path.dirname(session_directory))
+    report_directory = os.path.join(output_directory, f"{user}_{os.path.basename(session_directory)}")
+    os.makedirs(report_directory, exist_ok=True)
+    summary = {'session': os.path.basename(session_directory), 'user': user[:-5] if user.endswith('_data') else user,
+               'path': session_directory}
+
+    model = calibrate(session_directory)
+    if getattr(model, 'residuals', None) is not None:  # Legacy sklearn pipelines carry no diagnostics
+        summary['calibration_degree'] = model.degree
+        summary['calibration_mean_residual'] = float(np.mean(model.residuals))
+    gaze_path = os.path.join(session_directory, 'gazeData_calibrated.txt')
+    summary['calibrated'] = gaze_file_exists(gaze_path)
+    if not summary['calibrated']:
+        gaze_path = os.path.join(session_directory, 'gazeData.txt')
+    samples = load_gaze_data(gaze_path) if gaze_file_exists(gaze_path) else None
+
+    if samples is not None and len(samples):
+        layout = load_session_layout(session_directory)
+        summary['layout'] = 'saved' if layout is not None else 'recomputed'
+        screen_width, screen_height = layout.screen_size if layout is not None else screen_size
+        if layout is None:
+            layout = offscreen_layout(session_directory, screen_width, screen_height)
+        word_hits, fixations, metrics = run_word_analysis(
+            samples, layout.boxes, layout.identifiers, layout.words, screen_width, screen_height,
+            cache=SessionCache(session_directory), source_path=gaze_path)
+        summary.update(gaze_summary(samples, fixations))
+        summary.update(reading_summary(metrics))
+
+        write_word_hit_text(word_hits, os.path.join(report_directory, 'word_hit_counts.txt'))
+        _write_table(metrics, os.path.join(report_directory, 'reading_metrics.csv'))
+        _write_table(fixations, os.path.join(report_directory, 'fixations.csv'))
+
+        bin_size = default_bin_size(screen_width, screen_height)
+        valid = samples[samples['valid']]
+        screen_xs, screen_ys = normalize_gaze_array(valid['x'], valid['y'], screen_width, screen_height)
+        density = smooth_density(compute_density(screen_xs, screen_ys, screen_width, screen_height, bin_size), HEATMAP_SMOOTHING)
+        write_png(render_heatmap(density, screen_width, screen_height, bin_size, layout.boxes),
+                  os.path.join(report_directory, 'heatmap.png'))
+    else:
+        summary.update(start=None, sample_count=0)
+
+    summary['report_seconds'] = time.perf_counter() - started
+    with open(os.path.join(report_directory, 'summary.json'), 'w') as file:
+        json.dump(summary, file, indent=2)
+    return summary
+
+
+def generate_reports(sessions, output_directory, screen_size=DEFAULT_SCREEN_SIZE, processes=None):
+    """Report every session in a process pool; returns (summaries, failed session directories)."""
+    summaries, failed = [], []
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = {executor.submit(report_session, session, output_directory, screen_size): session for session in sessions}
+        for done, future in enumerate(as_completed(futures), 1):
+            session = futures[future]
+            try:
+                summaries.append(future.result())
+                print(f"[{done}/{len(sessions)}] {session}")
+            except Exception as e:
+                failed.append(session)
+                print(f"[{done}/{len(sessions)}] {session} failed: {e}")
+    return summaries, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate offline reports for recorded sessions.")
+    parser.add_argument('paths', nargs='*', help="Session, user (_data) or data folders (default: the data root)")
+    parser.add_argument('--output', default='reports', help="Folder that receives one report folder per session")
+    parser.add_argument('--processes', type=int, default=None, help="Worker processes (default: one per CPU)")
+    parser.add_argument('--width', type=int, default=DEFAULT_SCREEN_SIZE[0], help="Screen width for sessions without a saved layout")
+    parser.add_argument('--height', type=int, default=DEFAULT_SCREEN_SIZE[1], help="Screen height for sessions without a saved layout")
+    args = parser.parse_args()
+
+    sessions = sorted({session for path in (args.paths or [app_config.data_root]) for session in find_sessions(path)})
+    if not sessions:
+        print("No sessions found.")
+        return 1
+    output_directory = os.path.abspath(args.output)
+    os.makedirs(output_directory, exist_ok=True)
+    started = time.perf_counter()
+    summaries, failed = generate_reports(sessions, output_directory, (args.width, args.height), args.processes)
+    summaries.sort(key=lambda summary: (summary['user'], summary.get('start') or 0))
+    with open(os.path.join(output_directory, 'index.json'), 'w') as file:
+        json.dump(summaries, file, indent=2)
+    print(f"{len(summaries)} report(s) written to {output_directory} in {time.perf_counter() - started:.1f} s"
+          + (f", {len(failed)} failed" if failed else ""))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
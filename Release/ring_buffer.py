@@ -0,0 +1,79 @@
+# ring_buffer.py
+import threading
+
+import numpy as np
+
+from gaze_io import GAZE_DTYPE
+
+DEFAULT_CAPACITY = 120 * 60 * 10  # Ten minutes at 120 Hz
+
+
+class GazeRingBuffer:
+    """ Fixed-capacity, preallocated buffer of GAZE_DTYPE samples.
+
+    Every sample is written twice, at i and i + capacity, so the newest N samples
+    (N <= capacity) are always one contiguous slice of the storage. latest() and
+    window() therefore return zero-copy NumPy views, oldest sample first. Memory
+    stays at 2 * capacity records however long the session runs.
+
+    Views alias the storage and are only valid until the writer overwrites them;
+    consumers on another thread than the writer should use snapshot() instead.
+    """
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self._data = np.zeros(2 * self.capacity, dtype=GAZE_DTYPE)
+        self._count = 0  # Total samples ever written
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    @property
+    def total_written(self):
+        return self._count
+
+    def clear(self):
+        with self._lock:
+            self._count = 0
+
+    def append(self, timestamp, x, y, valid=True):
+        with self._lock:
+            position = self._count % self.capacity
+            self._data[position] = self._data[position + self.capacity] = (timestamp, x, y, valid)
+            self._count += 1
+
+    def extend(self, samples):
+        samples = np.asarray(samples, dtype=GAZE_DTYPE)
+        with self._lock:
+            if len(samples) > self.capacity:
+                self._count += len(samples) - self.capacity
+                samples = samples[-self.capacity:]
+            start = self._count % self.capacity
+            head = min(len(samples), self.capacity - start)
+            for offset in (0, self.capacity):
+                self._data[offset + start:offset + start + head] = samples[:head]
+                self._data[offset:offset + len(samples) - head] = samples[head:]
+            self._count += len(samples)
+
+    def latest(self, count=None):
+        """Zero-copy view of the newest count samples (all buffered samples by default)."""
+        size = len(self)
+        count = size if count is None else max(min(int(count), size), 0)
+        end = self._count % self.capacity + self.capacity
+        view = self._data[end - count:end]
+        view.flags.writeable = False
+        return view
+
+    def window(self, seconds):
+        """Zero-copy view of the samples recorded in the last `seconds` before the newest one."""
+        view = self.latest()
+        if not len(view):
+            return view
+        cutoff = view['timestamp'][-1] - int(seconds * 1e6)
+        return view[np.searchsorted(view['timestamp'], cutoff, side='left'):]
+
+    def snapshot(self, seconds=None):
+        """Copy of window(seconds) (or of every buffered sample) taken under the writer lock."""
+        with self._lock:
+            view = self.latest() if seconds is None else self.window(seconds)
+            return view.copy()
@@ -0,0 +1,139 @@
+# session_cache.py
+import hashlib, json, os, shutil, time
+
+import numpy as np
+
+CACHE_DIRNAME = '.cache'
+MANIFEST_FILENAME = 'manifest.json'
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_file_hashes = {}  # (path, size, mtime_ns) -> digest, so unchanged files are hashed once per process
+
+
+def file_hash(path):
+    """Content hash of a file, or None if it does not exist."""
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    signature = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if signature not in _file_hashes:
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+        _file_hashes[signature] = digest.hexdigest()
+    return _file_hashes[signature]
+
+
+def make_key(source_files=(), **parameters):
+    """Cache key from the contents of source_files and any JSON-serializable parameters.
+
+    Typical parameters are the screen geometry, bin sizes or detection thresholds;
+    numpy arrays (e.g. word boxes) are hashed by their bytes.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for path in source_files:
+        digest.update(f"{os.path.basename(path)}={file_hash(path)};".encode())
+    for name in sorted(parameters):
+        value = parameters[name]
+        if isinstance(value, np.ndarray):
+            digest.update(f"{name}=".encode() + np.ascontiguousarray(value).tobytes() + str(value.dtype).encode())
+        else:
+            digest.update(f"{name}={json.dumps(value, sort_keys=True, default=str)};".encode())
+    return digest.hexdigest()
+
+
+class SessionCache:
+    """ Derived artifacts of one session, stored as .npz files in <session>/.cache.
+
+    Each entry is a named group of arrays stored with the key it was computed
+    for; get() only returns it while the key still matches, so entries
+    invalidate themselves when their source file, calibration model or screen
+    geometry change. The cache is kept under max_bytes by evicting the least
+    recently used entries.
+    """
+    def __init__(self, session_directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.session_directory = session_directory
+        self.directory = os.path.join(session_directory, CACHE_DIRNAME)
+        self.max_bytes = max_bytes
+        self._manifest_path = os.path.join(self.directory, MANIFEST_FILENAME)
+
+    def _read_manifest(self):
+        try:
+            with open(self._manifest_path, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_manifest(self, manifest):
+        os.makedirs(self.directory, exist_ok=True)
+        temporary_path = self._manifest_path + '.tmp'
+        with open(temporary_path, 'w') as file:
+            json.dump(manifest, file, indent=1)
+        os.replace(temporary_path, self._manifest_path)
+
+    def _remove(self, manifest, name):
+        entry = manifest.pop(name, None)
+        if entry:
+            try:
+                os.remove(os.path.join(self.directory, entry['file']))
+            except OSError:
+                pass
+
+    def get(self, name, key):
+        """The arrays stored under name as a dict, or None if missing or stale."""
+        manifest = self._read_manifest()
+        entry = manifest.get(name)
+        if not entry or entry['key'] != key:
+            return None
+        try:
+            with np.load(os.path.join(self.directory, entry['file'])) as data:
+                arrays = {array_name: data[array_name] for array_name in data.files}
+        except (OSError, ValueError):
+            self._remove(manifest, name)
+            self._write_manifest(manifest)
+            return None
+        entry['last_used'] = time.time()
+        self._write_manifest(manifest)
+        return arrays
+
+    def put(self, name, key, **arrays):
+        os.makedirs(self.directory, exist_ok=True)
+        manifest = self._read_manifest()
+        self._remove(manifest, name)
+        filename = f"{name}.npz"
+        file_path = os.path.join(self.directory, filename)
+        np.savez(file_path, **arrays)
+        manifest[name] = {'key': key, 'file': filename, 'size': os.path.getsize(file_path), 'last_used': time.time()}
+        self._evict(manifest, keep=name)
+        self._write_manifest(manifest)
+
+    def get_or_compute(self, name, key, compute):
+        """Cached arrays for name, or the dict returned by compute() after storing it."""
+        arrays = self.get(name, key)
+        if arrays is None:
+            arrays = compute()
+            self.put(name, key, **arrays)
+        return arrays
+
+    def _evict(self, manifest, keep=None):
+        total = sum(entry['size'] for entry in manifest.values())
+        for name in sorted(manifest, key=lambda entry_name: manifest[entry_name]['last_used']):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            total -= manifest[name]['size']
+            self._remove(manifest, name)
+
+    def entries(self):
+        """(name, size in bytes, last used epoch seconds) for every entry, largest first."""
+        manifest = self._read_manifest()
+        return sorted(((name, entry['size'], entry['last_used']) for name, entry in manifest.items()),
+                      key=lambda item: item[1], reverse=True)
+
+    def total_size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
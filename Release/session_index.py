@@ -0,0 +1,234 @@
+# session_index.py
+import hashlib, json, os, sqlite3
+from datetime import datetime
+
+from config import app_config
+from gaze_io import load_gaze_data, gaze_file_exists, binary_path_for
+
+INDEX_FILENAME = 'session_index.sqlite'
+USER_SUFFIX = '_data'
+INDEX_VERSION = 1
+# Files whose size and mtime decide whether a session's metadata is stale
+SIGNATURE_FILES = ('gazeData.txt', 'gazeData_calibrated.txt', 'custom_text.txt', 'calibration_model.npz')
+
+USER_SORTS = {'name': 'users.name', 'sessions': 'session_count DESC', 'latest': 'latest_session DESC'}
+SESSION_SORTS = {'date': 'created DESC', 'duration': 'duration_s DESC', 'samples': 'sample_count DESC',
+                 'calibrated': 'calibrated DESC, created DESC', 'name': 'name'}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    name TEXT PRIMARY KEY, mtime_ns INTEGER
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    user TEXT, name TEXT, created REAL, signature TEXT,
+    start INTEGER, duration_s REAL, sample_count INTEGER, calibrated INTEGER,
+    text_hash TEXT, text_preview TEXT, word_count INTEGER,
+    PRIMARY KEY (user, name)
+);
+"""
+
+
+def session_created(session_directory):
+    """Creation time of a session from its dd_mm_yyyy_hh_mm name, or the folder's mtime."""
+    try:
+        return datetime.strptime(os.path.basename(session_directory), "%d_%m_%Y_%H_%M").timestamp()
+    except ValueError:
+        return os.path.getmtime(session_directory)
+
+
+def _signature(session_directory):
+    signature = []
+    for filename in SIGNATURE_FILES:
+        for path in (os.path.join(session_directory, filename), binary_path_for(os.path.join(session_directory, filename))):
+            if os.path.exists(path):
+                stat = os.stat(path)
+                signature.append([os.path.basename(path), stat.st_size, stat.st_mtime_ns])
+    return json.dumps(signature)
+
+
+def session_metadata(session_directory):
+    """Recording, calibration and text metadata of one session folder."""
+    metadata = {'created': session_created(session_directory), 'start': None, 'duration_s': None,
+                'sample_count': 0, 'calibrated': False, 'text_hash': None, 'text_preview': None, 'word_count': None}
+    calibrated_path = os.path.join(session_directory, 'gazeData_calibrated.txt')
+    metadata['calibrated'] = gaze_file_exists(calibrated_path)
+    gaze_path = calibrated_path if metadata['calibrated'] else os.path.join(session_directory, 'gazeData.txt')
+    if gaze_file_exists(gaze_path):
+        timestamps = load_gaze_data(gaze_path, cache_binary=False)['timestamp']  # Indexing leaves the folder untouched
+        if len(timestamps):
+            metadata.update(start=int(timestamps[0]), sample_count=len(timestamps),
+                            duration_s=(int(timestamps[-1]) - int(timestamps[0])) / 1e6)
+    text_path = os.path.join(session_directory, 'custom_text.txt')
+    if os.path.exists(text_path):
+        with open(text_path, 'r') as file:
+            text = file.read()
+        metadata.update(text_hash=hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest(),
+                        text_preview=' '.join(text.split())[:60], word_count=len(text.split()))
+    return metadata
+
+
+def _like_pattern(text):
+    """Substring pattern for LIKE ... ESCAPE '\\' that matches % and _ literally."""
+    return '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+class SessionIndex:
+    """ SQLite index of the users and sessions under the data root.
+
+    Holds one row per user and per session with summary metadata, so the user
+    page can list, sort and filter without scanning folders. refresh() brings it
+    up to date incrementally: only user folders whose mtime changed are listed
+    again, and only sessions whose gaze or text files changed are re-read.
+    Sessions are parsed outside of transactions and the database is in WAL mode,
+    so a refresh on another thread (with its own SessionIndex) does not block
+    readers.
+    """
+    def __init__(self, data_root=None):
+        self.data_root = data_root or app_config.data_root
+        os.makedirs(self.data_root, exist_ok=True)
+        self.path = os.path.join(self.data_root, INDEX_FILENAME)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+            self.connection.executescript("DROP TABLE IF EXISTS users; DROP TABLE IF EXISTS sessions;")
+            self.connection.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+        self.connection.executescript(_SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def user_directory(self, user):
+        return os.path.join(self.data_root, user + USER_SUFFIX)
+
+    def session_directory(self, user, session):
+        return os.path.join(self.user_directory(user), session)
+
+    def refresh(self):
+        """Sync the index with the data root; returns the number of changed sessions."""
+        on_disk = {}
+        for entry in os.scandir(self.data_root):
+            if entry.is_dir() and entry.name.endswith(USER_SUFFIX):
+                on_disk[entry.name[:-len(USER_SUFFIX)]] = entry.stat().st_mtime_ns
+        known = {row['name']: row['mtime_ns'] for row in self.connection.execute("SELECT name, mtime_ns FROM users")}
+        with self.connection:
+            for user in known.keys() - on_disk.keys():
+                self._delete_user(user)
+        changed = 0
+        for user, mtime_ns in on_disk.items():
+            if known.get(user) != mtime_ns:
+                changed += self.refresh_user(user)
+        return changed
+
+    def refresh_user(self, user):
+        """Re-list one user's sessions and re-read the ones that changed."""
+        user_directory = self.user_directory(user)
+        if not os.path.isdir(user_directory):
+            self.remove_user(user)
+            return 0
+        mtime_ns = os.stat(user_directory).st_mtime_ns
+        known = {row['name']: row['signature'] for row in
+                 self.connection.execute("SELECT name, signature FROM sessions WHERE user = ?", (user,))}
+        on_disk = [entry.name for entry in os.scandir(user_directory) if entry.is_dir() and not entry.name.startswith('.')]
+        rows = [self._session_row(user, session) for session in on_disk
+                if known.get(session) != _signature(self.session_directory(user, session))]
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO users (name, mtime_ns) VALUES (?, ?)", (user, mtime_ns))
+            for session in known.keys() - set(on_disk):
+                self.connection.execute("DELETE FROM sessions WHERE user = ? AND name = ?", (user, session))
+            self._store_sessions(rows)
+        return len(rows)
+
+    def _session_row(self, user, session):
+        session_directory = self.session_directory(user, session)
+        metadata = session_metadata(session_directory)
+        return (user, session, metadata['created'], _signature(session_directory), metadata['start'],
+                metadata['duration_s'], metadata['sample_count'], int(metadata['calibrated']),
+                metadata['text_hash'], metadata['text_preview'], metadata['word_count'])
+
+    def _store_sessions(self, rows):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO sessions (user, name, created, signature, start, duration_s, sample_count, calibrated,"
+            " text_hash, text_preview, word_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def _delete_user(self, user):
+        self.connection.execute("DELETE FROM sessions WHERE user = ?", (user,))
+        self.connection.execute("DELETE FROM users WHERE name = ?", (user,))
+
+    # Incremental updates for folders created or deleted by the application
+    def add_user(self, user):
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO users (name, mtime_ns) VALUES (?, ?)",
+                                    (user, os.stat(self.user_directory(user)).st_mtime_ns))
+
+    def remove_user(self, user):
+        with self.connection:
+            self._delete_user(user)
+
+    def update_session(self, user, session):
+        """Re-read one session's metadata, e.g. after recording or calibrating it."""
+        row = self._session_row(user, session)
+        with self.connection:
+            self._store_sessions([row])
+            self.connection.execute("INSERT OR REPLACE INTO users (name, mtime_ns) VALUES (?, ?)",
+                                    (user, os.stat(self.user_directory(user)).st_mtime_ns))
+
+    add_session = update_session
+
+    def remove_session(self, user, session):
+        with self.connection:
+            self.connection.execute("DELETE FROM sessions WHERE user = ? AND name = ?", (user, session))
+            if os.path.isdir(self.user_directory(user)):
+                self.connection.execute("UPDATE users SET mtime_ns = ? WHERE name = ?",
+                                        (os.stat(self.user_directory(user)).st_mtime_ns, user))
+
+    # Queries
+    def users(self, filter_text='', sort='name'):
+        """Rows of name, session_count and latest_session, filtered by a name substring."""
+        return self.connection.execute(
+            "SELECT users.name, COUNT(sessions.name) AS session_count, MAX(sessions.created) AS latest_session"
+            " FROM users LEFT JOIN sessions ON sessions.user = users.name"
+            " WHERE users.name LIKE ? ESCAPE '\\' GROUP BY users.name ORDER BY " + USER_SORTS.get(sort, USER_SORTS['name']),
+            (_like_pattern(filter_text),)).fetchall()
+
+    def sessions(self, user, filter_text='', sort='date', calibrated_only=False):
+        """Session rows of a user; filter_text matches the session name or its text."""
+        return self.connection.execute(
+            "SELECT * FROM sessions WHERE user = ? AND (name LIKE ? ESCAPE '\\' OR IFNULL(text_preview, '') LIKE ? ESCAPE '\\')"
+            + (" AND calibrated = 1" if calibrated_only else "")
+            + " ORDER BY " + SESSION_SORTS.get(sort, SESSION_SORTS['date']),
+            (user, _like_pattern(filter_text), _like_pattern(filter_text))).fetchall()
+
+
+def index_session(session_directory, data_root=None):
+    """Bring the index row of one session folder up to date after it was recorded or calibrated.
+
+    Folders that are not a <user>_data/<session> folder of the data root are ignored.
+    """
+    user_directory, session = os.path.split(os.path.abspath(session_directory))
+    root, user_folder = os.path.split(user_directory)
+    if not user_folder.endswith(USER_SUFFIX) or root != os.path.abspath(data_root or app_config.data_root):
+        return False
+    try:
+        index = SessionIndex(data_root)
+        try:
+            index.update_session(user_folder[:-len(USER_SUFFIX)], session)
+        finally:
+            index.close()
+    except (OSError, sqlite3.Error) as e:
+        print(f"Could not update the session index: {e}")
+        return False
+    return True
+
+
+def describe_session(row):
+    """One-line summary of a session row for lists."""
+    parts = [row['name']]
+    if row['sample_count']:
+        parts.append(f"{row['duration_s']:.0f} s, {row['sample_count']} samples")
+    else:
+        parts.append("no recording")
+    parts.append("calibrated" if row['calibrated'] else "not calibrated")
+    if row['text_preview']:
+        parts.append(f"\"{row['text_preview'][:30]}\"")
+    return "  |  ".join(parts)
@@ -0,0 +1,61 @@
+# streaming.py
+import os
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from gaze_io import parse_gaze_text
+from ring_buffer import GazeRingBuffer, DEFAULT_CAPACITY
+
+
+class GazeStreamReader(QObject):
+    """ Tails a gaze log while the recorder is still writing it.
+
+    A QTimer polls the file for newly appended bytes, so reading never blocks the
+    Qt event loop. Complete lines are parsed incrementally, appended to the ring
+    buffer and announced through samples_received; a trailing partial line is kept
+    until the recorder finishes writing it.
+    """
+    samples_received = pyqtSignal(object)
+
+    POLL_INTERVAL_MS = 15
+
+    def __init__(self, file_path, buffer=None, parent=None):
+        super().__init__(parent)
+        self.file_path = file_path
+        self.buffer = buffer if buffer is not None else GazeRingBuffer(DEFAULT_CAPACITY)
+        self._file = None
+        self._pending = b''
+        self._timer = QTimer(self)
+        self._timer.setInterval(self.POLL_INTERVAL_MS)
+        self._timer.timeout.connect(self.poll)
+
+    def start(self):
+        self._pending = b''
+        self._timer.start()
+
+    def stop(self):
+        """Read whatever the recorder wrote last, then stop polling."""
+        self._timer.stop()
+        self.poll()
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def poll(self):
+        if self._file is None:
+            if not os.path.exists(self.file_path):
+                return
+            self._file = open(self.file_path, 'rb')
+        chunk = self._file.read()
+        if not chunk:
+            return
+        data = self._pending + chunk
+        complete, _, self._pending = data.rpartition(b'\n')
+        if not complete:
+            return
+        samples, skipped = parse_gaze_text(complete.decode('utf-8', errors='replace'))
+        if skipped:
+            print(f"Skipped {skipped} malformed streamed line(s) in {self.file_path}")
+        if len(samples):
+            self.buffer.extend(samples)
+            self.samples_received.emit(samples)
@@ -0,0 +1,69 @@
+# test_playback_keys.py
+import os, sys
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+pytest.importorskip('PyQt5')
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import Qt
+from PyQt5.QtTest import QTest
+
+from config import app_config
+
+
+def write_session(directory, seconds=30, rate=30):
+    """A session with a calibrated recording slowly sweeping the screen."""
+    lines = []
+    for index in range(seconds * rate):
+        millis = index * 1000 // rate
+        lines.append(f"[2024-05-15 18:{52 + millis // 60000:02d}:{millis // 1000 % 60:02d}.{millis % 1000:03d}] "
+                     f"Gaze point: [{-0.8 + 1.6 * index / (seconds * rate):.4f}, 0.1]\n")
+    with open(os.path.join(directory, 'gazeData_calibrated.txt'), 'w') as file:
+        file.writelines(lines)
+
+
+def press(window, key):
+    """Send a key the way a user would: to whichever widget has keyboard focus."""
+    QTest.keyClick(QApplication.focusWidget() or window, key)
+
+
+@pytest.fixture
+def visualizer(tmp_path):
+    app = QApplication.instance() or QApplication([])
+    from ui_components import GazeVisualizer
+    write_session(tmp_path)
+    app_config.session_directory = str(tmp_path)
+    window = GazeVisualizer(1280, 720)
+    window.show()
+    QTest.qWaitForWindowExposed(window)
+    QTest.mouseClick(window.playback_button, Qt.LeftButton)
+    assert window.gaze_processor.isRunning()
+    yield window
+    window.gaze_processor.stop()
+    window.close()
+    app.processEvents()
+
+
+def test_space_pauses_after_clicking_playback(visualizer):
+    press(visualizer, Qt.Key_Space)
+    assert visualizer.gaze_processor.isRunning()
+    assert visualizer.gaze_processor.clock.paused
+    press(visualizer, Qt.Key_Space)
+    assert not visualizer.gaze_processor.clock.paused
+
+
+def test_arrows_change_speed_and_seek_after_clicking_playback(visualizer):
+    clock = visualizer.gaze_processor.clock
+    press(visualizer, Qt.Key_Up)
+    assert clock.speed == 2.0
+    press(visualizer, Qt.Key_Down)
+    press(visualizer, Qt.Key_Down)
+    assert clock.speed == 0.5
+    clock.pause()
+    before = clock.current_index()
+    press(visualizer, Qt.Key_Right)
+    assert clock.current_index() > before
+    assert visualizer.focusWidget() not in visualizer.other_buttons
@@ -0,0 +1,95 @@
+# text_layout.py
+import glob, hashlib, json, os
+
+import numpy as np
+
+# Layouts of the reading text are saved next to custom_text.txt as
+# text_layout_<key>.npz, one file per (text, font, screen size, DPI), so
+# sessions can be mapped from gaze to words later without Qt.
+LAYOUT_PREFIX = 'text_layout_'
+LAYOUT_VERSION = 1
+
+
+class WordLayout:
+    """ Positions of the words of a text on screen.
+
+    boxes is an (N, 4) int64 array of x, y, width, height in window coordinates,
+    in reading order; identifiers are the "y-x" keys used in word_hit_counts.txt
+    (taken before the text is centred vertically, as they always have been).
+    parameters holds what the layout was computed for (font, screen size, DPI).
+    """
+    def __init__(self, words, identifiers, boxes, total_text_height, parameters=None):
+        self.words = words
+        self.identifiers = identifiers
+        self.boxes = boxes
+        self.total_text_height = total_text_height
+        self.parameters = parameters or {}
+
+    def __len__(self):
+        return len(self.words)
+
+    @property
+    def screen_size(self):
+        return self.parameters.get('screen_width'), self.parameters.get('screen_height')
+
+
+def layout_key(text, font_family, font_size, line_spacing_factor, screen_width, screen_height, dpi):
+    digest = hashlib.blake2b(digest_size=12)
+    digest.update(text.encode('utf-8'))
+    digest.update(json.dumps([LAYOUT_VERSION, font_family, font_size, line_spacing_factor,
+                              screen_width, screen_height, dpi]).encode())
+    return digest.hexdigest()
+
+
+def layout_path(directory, key):
+    return os.path.join(directory, f"{LAYOUT_PREFIX}{key}.npz")
+
+
+def save_layout(layout, file_path):
+    temporary_path = file_path + '.tmp.npz'
+    np.savez(temporary_path,
+             version=np.array(LAYOUT_VERSION),
+             words=np.array(layout.words, dtype=str),
+             identifiers=np.array(layout.identifiers, dtype=str),
+             boxes=layout.boxes,
+             total_text_height=np.array(layout.total_text_height, dtype=np.float64),
+             parameters=np.array(json.dumps(layout.parameters)))
+    os.replace(temporary_path, file_path)
+
+
+def read_layout(file_path):
+    with np.load(file_path, allow_pickle=False) as data:
+        if int(data['version']) != LAYOUT_VERSION:
+            raise ValueError(f"Unsupported text layout version in {file_path}")
+        return WordLayout(data['words'].tolist(), data['identifiers'].tolist(), data['boxes'],
+                          float(data['total_text_height']), json.loads(str(data['parameters'])))
+
+
+def session_has_content(directory):
+    """Whether a session folder has custom text or gaze data, i.e. is worth saving a layout into."""
+    return (os.path.exists(os.path.join(directory, 'custom_text.txt'))
+            or bool(glob.glob(os.path.join(directory, 'gazeData*'))))
+
+
+def load_layout(directory, key):
+    """The saved layout for key in directory, or None."""
+    file_path = layout_path(directory, key)
+    if not os.path.exists(file_path):
+        return None
+    try:
+        layout = read_layout(file_path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Ignoring unreadable text layout: {e}")
+        return None
+    return layout
+
+
+def load_session_layout(session_directory):
+    """The layout most recently used to show the text of a session, or None.
+
+    This is the layout to map the session's gaze data to words with offline.
+    """
+    paths = glob.glob(os.path.join(session_directory, f"{LAYOUT_PREFIX}*.npz"))
+    if not paths:
+        return None
+    return read_layout(max(paths, key=os.path.getmtime))
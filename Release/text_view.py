@@ -0,0 +1,123 @@
+# text_view.py
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtGui import QPainter, QColor, QFont, QFontMetrics
+from PyQt5.QtCore import Qt, QRect
+
+import os
+
+import numpy as np
+
+from text_layout import WordLayout, layout_key, layout_path, load_layout, save_layout, session_has_content
+
+WORD_BACKGROUND = QColor(225, 225, 225, 178)  # Slightly darker shade of white, 70% opaque
+TEXT_COLOR = QColor(0, 0, 0)
+
+
+_layouts = {}  # Layouts computed or loaded by this process, by layout_key
+
+
+def layout_text(text, font, screen_width, screen_height, line_spacing_factor, dpi=None):
+    """Break text into lines of words with QFontMetrics and return a WordLayout."""
+    fm = QFontMetrics(font)
+    line_height = fm.height()
+    line_step = int(line_height * line_spacing_factor)
+
+    x_start = screen_width * 0.1  # Start 10% from the left, 80% of screen width for text
+    top_margin = screen_height * 0.08  # Distance from the top edge
+    bottom_margin = screen_height * 0.15  # Distance from the bottom edge
+    x, y = x_start, top_margin
+
+    words = text.split()
+    widths = {}  # Measure every distinct word once
+    identifiers = []
+    boxes = np.empty((len(words), 4), dtype=np.int64)
+    boxes[:, 3] = line_height
+    for index, word in enumerate(words):
+        if word not in widths:
+            widths[word] = (fm.size(0, word).width(), fm.width(word + ' '))  # Same size a QLabel would take
+        width, advance = widths[word]
+        if x + advance > screen_width - x_start:
+            x = x_start
+            y += line_step
+        identifiers.append(f"{y}-{x}")
+        boxes[index, 0], boxes[index, 1], boxes[index, 2] = int(x), int(y), width
+        x += advance
+
+    # Centre the text vertically between the margins if it is short enough
+    total_text_height = y + line_height - top_margin
+    if total_text_height < screen_height - bottom_margin:
+        extra_space = (screen_height - bottom_margin - total_text_height) / 2
+        total_text_height += 2 * extra_space
+        boxes[:, 1] = (boxes[:, 1] + extra_space).astype(np.int64)
+    parameters = {'font_family': font.family(), 'font_size': font.pointSize(), 'line_spacing_factor': line_spacing_factor,
+                  'screen_width': screen_width, 'screen_height': screen_height, 'dpi': dpi}
+    return WordLayout(words, identifiers, boxes, total_text_height + top_margin, parameters)
+
+
+def cached_layout(text, font, screen_width, screen_height, line_spacing_factor, dpi, directory=None):
+    """layout_text, computed once per (text, font, screen size, DPI).
+
+    With a session directory the layout is also looked up in and saved to it,
+    next to custom_text.txt, once the session has text or gaze data (so merely
+    selecting a new session leaves it empty).
+    """
+    key = layout_key(text, font.family(), font.pointSize(), line_spacing_factor, screen_width, screen_height, dpi)
+    layout = _layouts.get(key)
+    if layout is None and directory:
+        layout = load_layout(directory, key)
+    if layout is None:
+        layout = layout_text(text, font, screen_width, screen_height, line_spacing_factor, dpi)
+    _layouts[key] = layout
+    if directory and session_has_content(directory):
+        file_path = layout_path(directory, key)
+        if os.path.exists(file_path):
+            os.utime(file_path)
+        else:
+            save_layout(layout, file_path)
+    return layout
+
+
+class TextView(QWidget):
+    """ Draws the reading text in one paintEvent from a WordLayout.
+
+    Replaces one QLabel per word; the widget is transparent to mouse events and
+    only repaints the words intersecting the exposed region.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self._font = QFont()
+        self._word_layout = WordLayout([], [], np.zeros((0, 4), dtype=np.int64), 0)
+
+    def set_text(self, text, font, screen_width, screen_height, line_spacing_factor, directory=None):
+        self._font = font
+        self._word_layout = cached_layout(text, font, screen_width, screen_height, line_spacing_factor,
+                                          self.logicalDpiX(), directory)
+        self.update()
+        return self._word_layout
+
+    @property
+    def word_layout(self):
+        return self._word_layout
+
+    @property
+    def word_boxes(self):
+        return self._word_layout.boxes
+
+    def paintEvent(self, event):
+        boxes = self._word_layout.boxes
+        if not len(boxes):
+            return
+        exposed = event.rect()
+        left, top, width, height = boxes.T
+        visible = np.flatnonzero((left < exposed.right() + 1) & (left + width > exposed.left()) &
+                                 (top < exposed.bottom() + 1) & (top + height > exposed.top()))
+        painter = QPainter(self)
+        painter.setFont(self._font)
+        painter.setPen(TEXT_COLOR)
+        words = self._word_layout.words
+        for index in visible.tolist():
+            rect = QRect(*boxes[index].tolist())
+            painter.fillRect(rect, WORD_BACKGROUND)
+            painter.drawText(rect, Qt.AlignLeft | Qt.AlignVCenter, words[index])
+        painter.end()
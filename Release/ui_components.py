@@ -1,16 +1,37 @@
 # ui_components.py
 
-from PyQt5.QtWidgets import QApplication, QMainWindow, QLabel, QWidget, QPushButton, QVBoxLayout, QHBoxLayout, QSpacerItem, QSizePolicy
-from PyQt5.QtGui import QPainter, QColor, QFont, QFontMetrics, QPen
+from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QPushButton, QVBoxLayout, QHBoxLayout, QSpacerItem, QSizePolicy
+from PyQt5.QtGui import QPainter, QColor, QFont, QPen
 from PyQt5.QtCore import Qt, QThread, pyqtSignal, QRect, QPoint
 import sys, subprocess, os
 from datetime import datetime
+import numpy as np
 from overlays import GazeOverlay, HeatmapOverlay
-from data_handling import normalize_gaze_to_screen, parse_word_hit_counts, GazeDataProcessor
-from calibration import CalibrationScreen
-from userpage import UserPage
+from text_view import TextView
+from gaze_io import load_gaze_data, normalize_gaze_array, gaze_file_exists
+from streaming import GazeStreamReader
+from ring_buffer import GazeRingBuffer, DEFAULT_CAPACITY
+from session_index import index_session
 from ui_styles import get_button_style, get_exit_button_style, get_label_style, get_text_content, get_theme 
 from config import app_config
+
+RECORDER_STOP_TIMEOUT = 2.0  # Seconds a terminated recorder gets to exit before it is killed
+HEATMAP_SMOOTHING_STEPS = (0.0, 1.0, 2.0, 4.0)  # Gaussian sigmas in bins, cycled with S
+HEATMAP_BIN_STEP = 1.5  # Factor by which + and - change the heatmap bin size
+
+class ComparisonWorker(QThread):
+    """ Computes (or reads from the session caches) the grids of a heatmap comparison off the UI thread. """
+    computed = pyqtSignal(object, int)  # (name, grid, signed) views and the bin size they were computed with
+
+    def __init__(self, groups, width, height, bin_size, parent=None):
+        super().__init__(parent)
+        self.groups = groups
+        self.width, self.height, self.bin_size = width, height, bin_size
+
+    def run(self):
+        from comparison import comparison_views
+        self.computed.emit(comparison_views(self.groups, self.width, self.height, self.bin_size), self.bin_size)
+
 class GazeVisualizer(QMainWindow):
 
     def __init__(self, screen_width, screen_height):
@@ -19,10 +40,18 @@ class GazeVisualizer(QMainWindow):
         self.is_night_mode = False  # Track whether night mode is active
         self.dwell_data = None
         self.other_buttons = []  # Store references to other buttons
+        self.text_view = None
+        self.gaze_buffer = GazeRingBuffer(DEFAULT_CAPACITY)  # Shared by recording, playback and the gaze trail
         self.setupUI()
         self.current_directory = None  # Initialize the directory attribute
         self.recording_process = None
+        self.stream_reader = None
+        self.recorder_log = None
         self.gaze_processor = None
+        self.heatmap_overlay = None
+        self.heatmap_live = False  # The heatmap follows playback through add_points
+        self.heatmap_views = []  # (name, grid, signed) shown by showComparisonHeatmaps
+        self.comparison_worker = None
     
     def toggle_night_mode(self):
         # Toggle the night mode state and update the stylesheet
@@ -38,14 +67,13 @@ class GazeVisualizer(QMainWindow):
         self.setStyleSheet(get_theme("default"))  # Start with the default theme
         self.setupLabels()
         self.setupButtons()
-        self.gaze_overlay = GazeOverlay(self)
+        self.gaze_overlay = GazeOverlay(self, buffer=self.gaze_buffer)
         self.gaze_overlay.setGeometry(0, 0, self.screen_width, self.screen_height)
 
     def hideUI(self):
         # Hide all non-essential UI elements except 'Next' and 'Exit'
         #self.night_mode_button.hide()
-        for label in self.labels:
-            label[1].hide()
+        self.text_view.hide()
         self.gaze_overlay.hide()
         for button in self.other_buttons:
             button.hide()
@@ -54,57 +82,26 @@ class GazeVisualizer(QMainWindow):
     def showUI(self):
         # Restore all UI elements after calibration
         #self.night_mode_button.show()
-        for label in self.labels:
-            label[1].show()
+        self.text_view.show()
         self.gaze_overlay.show()
         for button in self.other_buttons:
             button.show()
         self.exit_button.show()  # Show the exit button again
 
-    def setupLabels(self, text=None):
+    def setupLabels(self, text=None, directory=None):
 
         if text is None:
             text = get_text_content()
 
         font_family, font_size, line_spacing_factor = get_label_style(self.screen_height)
-        font = QFont(font_family, font_size)
-        fm = QFontMetrics(font)
-        line_height = fm.height()
-
-        max_line_width = self.screen_width * 0.8  # Use 80% of screen width for text
-        x_start = self.screen_width * 0.1  # Start 10% from the left
-        top_margin = self.screen_height * 0.08  # Adjust the top margin to increase distance from the top edge
-        bottom_margin = self.screen_height * 0.15  # Adjust the bottom margin to increase distance from the bottom edge
-        x, y = x_start, top_margin
-
-        self.labels = []
-        for word in text.split():
-            word_width = fm.width(word + ' ')
-            if x + word_width > self.screen_width - x_start:
-                x = x_start
-                y += int(line_height * line_spacing_factor)
-
-            identifier = f"{y}-{x}"
-            label = QLabel(word, self)
-            label.setFont(font)
-            label.adjustSize()
-            label.setStyleSheet("background-color: rgba(225, 225, 225, 0.7);")  # Slightly darker shade of white as background
-            label.move(int(x), int(y))
-            label.show()
-            self.labels.append((identifier, label, word))
-
-            x += word_width
-
-        # Adjust vertical position if necessary to ensure bottom margin
-        total_text_height = y + line_height - top_margin
-        if total_text_height < self.screen_height - bottom_margin:
-            extra_space = (self.screen_height - bottom_margin - total_text_height) / 2
-            total_text_height += 2 * extra_space
-            for identifier, label, word in self.labels:
-                label.move(label.x(), int(label.y() + extra_space))
-
-        self.total_text_height = total_text_height + top_margin  # Include the adjusted initial offset
-
+        if self.text_view is None:
+            # One widget draws every word; switching texts only replaces its layout
+            self.text_view = TextView(self)
+            self.text_view.setGeometry(0, 0, self.screen_width, self.screen_height)
+            self.text_view.show()
+        self.word_layout = self.text_view.set_text(text, QFont(font_family, font_size), self.screen_width, self.screen_height,
+                                                   line_spacing_factor, directory)  # Saved in the session for offline analysis
+        self.total_text_height = self.word_layout.total_text_height  # Include the adjusted initial offset
 
     def setupButtons(self):
         central_widget = QWidget(self)
@@ -117,6 +114,7 @@ class GazeVisualizer(QMainWindow):
         self.exit_button.setFixedSize(exit_button_size, exit_button_size)
         self.exit_button.clicked.connect(self.close)
         self.exit_button.setStyleSheet(get_exit_button_style(exit_button_size))
+        self.exit_button.setFocusPolicy(Qt.NoFocus)
         self.exit_button.move(self.width() - exit_button_size - margins, margins)  # Top right corner
         self.exit_button.setParent(central_widget)
 
@@ -145,6 +143,7 @@ class GazeVisualizer(QMainWindow):
             button.clicked.connect(func)
             button.setFixedSize(button_width, button_height)
             button.setStyleSheet(get_button_style(button_height))
+            button.setFocusPolicy(Qt.NoFocus)  # Keys stay with the window: space and the arrows control playback
             button.move(x_position, self.height() - button_height - margins)  # Position at bottom
             x_position += button_width + button_spacing
             button.setParent(central_widget)
@@ -154,22 +153,23 @@ class GazeVisualizer(QMainWindow):
         self.record_button = self.other_buttons[0]
         self.playback_button = self.other_buttons[1]
 
+    # Calibration, the user page, playback analysis and the heatmap import their
+    # modules on first use so that they do not delay the first window.
     def startCalibration(self):
+        from calibration import CalibrationScreen
         self.calibration_screen = CalibrationScreen(self)
         self.calibration_screen.show()
 
     def openUserPage(self):
-        # This assumes you have a class `UserPage` defined elsewhere
+        from userpage import UserPage
         self.user_page = UserPage(self)
         self.user_page.show()
     
     def toggleRecording(self):
         if self.recording_process:
             # Stop the recording if it is currently running
-            self.recording_process.terminate()
-            self.recording_process = None
+            self.stopRecording()
             self.record_button.setText("Record")  # Update button text to reflect available action
-            print("Recording stopped.")
         else:
             directory = app_config.session_directory
             if not directory:
@@ -178,22 +178,49 @@ class GazeVisualizer(QMainWindow):
             
             filename = 'gazeData.txt'
             file_path = os.path.join(directory, filename)
-            
-            open(file_path, 'w').close()  # Ensure the file is empty before starting to record
-            executable_path = "/Users/borana/Documents/GitHub/DyslexiaProject/Release/cpp_exec/Tobii_api_test1"
-            window_id = str(self.winId().__int__())
-            cmd = [executable_path, window_id, file_path]
-            self.recording_process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            cmd = self.launchRecorder(file_path)
+            if cmd is None:
+                return
             self.record_button.setText("Stop Recording")  # Update button text to reflect available action
             print(f"Starting general recording with command: {cmd}")
 
+    def launchRecorder(self, file_path):
+        """Start the recorder writing to file_path and stream its samples to the gaze overlay.
+
+        Returns the command line, or None if the recorder could not be started.
+        """
+        open(file_path, 'w').close()  # Ensure the file is empty before starting to record
+        self.updateTextDisplay()  # The session now has data, so its text layout gets saved
+        window_id = str(self.winId().__int__())
+        cmd = app_config.recorder_command + [window_id, file_path]
+        # Recorder output goes to a log file; undrained pipes would eventually block it
+        recorder_log = open(os.path.join(os.path.dirname(file_path), 'recorder.log'), 'a')
+        try:
+            self.recording_process = subprocess.Popen(cmd, stdout=recorder_log, stderr=subprocess.STDOUT)
+        except OSError as e:
+            recorder_log.close()
+            print(f"Could not start the recorder {cmd[0]}: {e}")
+            return None
+        self.recorder_log = recorder_log
+        self.gaze_buffer.clear()
+        self.stream_reader = GazeStreamReader(file_path, buffer=self.gaze_buffer, parent=self)
+        self.stream_reader.samples_received.connect(self.onStreamSamples)
+        self.stream_reader.start()
+        return cmd
+
+    def onStreamSamples(self, samples):
+        valid = samples[samples['valid']]
+        if len(valid):
+            screen_xs, screen_ys = normalize_gaze_array(valid['x'], valid['y'], self.width(), self.height())
+            self.gaze_overlay.update_gaze_positions(screen_xs, screen_ys)
+
     def togglePlayback(self):
         if self.gaze_processor and self.gaze_processor.isRunning():
-            # Stop the playback if it is currently running
-            self.gaze_processor.terminate()
-            self.gaze_processor = None
-            self.playback_button.setText("Playback")  # Update button text to reflect available action
-            print("Playback stopped.")
+            # Stop the playback cooperatively; onPlaybackFinished updates the button
+            if self.gaze_processor.stop():
+                print("Playback stopped.")
+            else:
+                print("Playback is still stopping; it will finish at its next check.")
         else:
             directory = app_config.session_directory
             if not directory:
@@ -203,29 +230,87 @@ class GazeVisualizer(QMainWindow):
             filename = 'gazeData_calibrated.txt'
             file_path = os.path.join(directory, filename)
 
-            if os.path.exists(file_path):
-                gaze_data = []
-                with open(file_path, 'r') as file:
-                    gaze_data = file.readlines()
-
-                self.gaze_processor = GazeDataProcessor(gaze_data, self.width(), self.height(), self.labels, directory)
-                self.gaze_processor.update_gaze_signal.connect(lambda ts, x, y: self.gaze_overlay.update_gaze_position(x, y))
-                self.gaze_processor.finished.connect(self.onPlaybackFinished)  # Connect the finished signal to the slot
-                self.gaze_processor.start()
+            if gaze_file_exists(file_path):
+                gaze_data = load_gaze_data(file_path)
+
+                if self.gaze_processor is None:
+                    from data_handling import GazeDataProcessor
+                    # A single worker is reused for every playback
+                    self.gaze_processor = GazeDataProcessor(buffer=self.gaze_buffer, frame_interval=self.gaze_overlay.frame_interval)
+                    self.gaze_processor.samples_played.connect(self.onPlaybackSamples)
+                    self.gaze_processor.finished.connect(self.onPlaybackFinished)  # Connect the finished signal to the slot
+                if not self.gaze_processor.stop():
+                    return  # The previous playback is still shutting down
+                self.gaze_buffer.clear()
+                self.gaze_processor.play(gaze_data, self.width(), self.height(), self.word_layout, directory, source_path=file_path)
                 self.playback_button.setText("Stop Playback")  # Update button text to reflect available action
                 print("Playback started.")
             else:
                 print("Calibrated gaze data file does not exist.")
     
+    def onPlaybackSamples(self, samples):
+        self.gaze_overlay.update_gaze_positions(samples['x'], samples['y'])
+        if self.heatmap_live and self.heatmap_overlay is not None:
+            self.heatmap_overlay.add_points(np.column_stack((samples['x'], samples['y'])))
+        if self.gaze_processor:
+            self.gaze_processor.frame_presented()
+
+    def keyPressEvent(self, event):
+        # T toggles the gaze trail and H the heatmap (+/- bin size, S smoothing);
+        # during playback space pauses/resumes, left/right seek 5 s, up/down change speed
+        if event.key() == Qt.Key_T:
+            self.gaze_overlay.set_trail(0 if self.gaze_overlay.trail_duration else GazeOverlay.TRAIL_DURATION)
+            return
+        if event.key() == Qt.Key_H:
+            self.closeHeatmap() if self.heatmap_overlay is not None else self.showHeatmap()
+            return
+        if self.heatmap_overlay is not None and event.key() in (Qt.Key_Plus, Qt.Key_Equal, Qt.Key_Minus, Qt.Key_S):
+            self.adjustHeatmap(event.key())
+            return
+        if self.heatmap_views and event.key() in (Qt.Key_PageUp, Qt.Key_PageDown, Qt.Key_Escape):
+            # Comparison heatmaps: page up/down switch views, escape closes them
+            if event.key() == Qt.Key_Escape:
+                self.closeHeatmap()
+            else:
+                self.showHeatmapView(self.heatmap_view_index + (1 if event.key() == Qt.Key_PageDown else -1))
+            return
+        if not (self.gaze_processor and self.gaze_processor.isRunning()):
+            super().keyPressEvent(event)
+            return
+        clock = self.gaze_processor.clock
+        key = event.key()
+        if key == Qt.Key_Space:
+            clock.resume() if clock.paused else clock.pause()
+        elif key == Qt.Key_Right:
+            clock.seek_relative(5)
+        elif key == Qt.Key_Left:
+            clock.seek_relative(-5)
+        elif key == Qt.Key_Up:
+            print(f"Playback speed: {clock.set_speed(clock.speed * 2)}x")
+        elif key == Qt.Key_Down:
+            print(f"Playback speed: {clock.set_speed(clock.speed / 2)}x")
+        else:
+            super().keyPressEvent(event)
+
     def onPlaybackFinished(self):
-        self.gaze_processor = None
         self.playback_button.setText("Playback")
         print("Playback finished.")
 
     def stopRecording(self):
         if self.recording_process:
             self.recording_process.terminate()
+            try:
+                self.recording_process.wait(RECORDER_STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                print("Recorder did not exit after terminate; killing it.")
+                self.recording_process.kill()
+                self.recording_process.wait()
             self.recording_process = None
+            self.stream_reader.stop()
+            index_session(os.path.dirname(self.stream_reader.file_path))  # The new recording shows up in the user page
+            self.stream_reader = None
+            self.recorder_log.close()
+            self.recorder_log = None
             print("Recording stopped.")
 
     def startCalibrationRecording(self, dot_id, directory):
@@ -235,11 +320,9 @@ class GazeVisualizer(QMainWindow):
 
         filename = f'gazeData_{dot_id}.txt'
         file_path = os.path.join(directory, filename)
-        open(file_path, 'w').close()  # Ensure the file is empty before starting to record
-        executable_path = "/Users/borana/Documents/GitHub/DyslexiaProject/Release/cpp_exec/Tobii_api_test1"
-        window_id = str(self.winId().__int__())
-        cmd = [executable_path, window_id, file_path]
-        self.recording_process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        cmd = self.launchRecorder(file_path)
+        if cmd is None:
+            return
         print(f"Starting calibration recording for dot {dot_id} with command: {cmd}")
 
     def setDirectory(self, directory):
@@ -254,7 +337,37 @@ class GazeVisualizer(QMainWindow):
     def updateTextDisplay(self):
         # This method updates the text content on the display
         text = get_text_content(app_config.session_directory)
-        self.setupLabels(text)  # Assuming setupLabels can take text as an argument
+        self.setupLabels(text, app_config.session_directory)
+
+    def showHeatmap(self):
+        """Heatmap of the running playback, growing with it, or else of the whole current session."""
+        if self.gaze_processor and self.gaze_processor.isRunning():
+            self.showLiveHeatmap()
+        else:
+            self.showHeatmapOnText()
+
+    def showLiveHeatmap(self):
+        samples = self.gaze_buffer.snapshot()  # Everything played so far
+        samples = samples[samples['valid']]
+        screen_xs, screen_ys = normalize_gaze_array(samples['x'], samples['y'], self.width(), self.height())
+        self.closeHeatmap()
+        self.heatmap_overlay = HeatmapOverlay(np.column_stack((screen_xs, screen_ys)), [], self)
+        self.heatmap_overlay.setGeometry(0, 0, self.width(), self.height())
+        self.heatmap_overlay.title = "Playback"
+        self.heatmap_overlay.show()
+        self.heatmap_live = True
+
+    def adjustHeatmap(self, key):
+        overlay = self.heatmap_overlay
+        if key == Qt.Key_S:
+            steps = HEATMAP_SMOOTHING_STEPS
+            smoothing = steps[(steps.index(overlay.smoothing) + 1) % len(steps)] if overlay.smoothing in steps else steps[0]
+            overlay.set_smoothing(smoothing)
+            print(f"Heatmap smoothing: {smoothing} bins")
+        else:
+            factor = HEATMAP_BIN_STEP if key == Qt.Key_Minus else 1 / HEATMAP_BIN_STEP  # Smaller bins show more detail
+            overlay.set_bin_size(max(round(overlay.bin_size * factor), 2))
+            print(f"Heatmap bin size: {overlay.bin_size} px")
 
     def showHeatmapOnText(self):
         """Show heatmap based on the gaze data stored in the current directory."""
@@ -266,18 +379,17 @@ class GazeVisualizer(QMainWindow):
         filename = 'gazeData_calibrated.txt'
         file_path = os.path.join(directory, filename)
 
-        if not os.path.exists(file_path):
+        if not gaze_file_exists(file_path):
             print("Gaze data file does not exist.")
             return
 
-        gaze_points = []
-        with open(file_path, 'r') as file:
-            for line in file:
-                if 'Gaze point:' in line:
-                    _, gaze_str = line.split('] Gaze point: ')
-                    gaze_point = [float(val) for val in gaze_str.strip()[1:-1].split(',')]
-                    screen_x, screen_y = normalize_gaze_to_screen(gaze_point, self.width(), self.height())
-                    gaze_points.append((screen_x, screen_y))
+        from data_handling import parse_word_hit_counts
+        from comparison import session_density
+
+        samples = load_gaze_data(file_path)
+        samples = samples[samples['valid']]
+        screen_xs, screen_ys = normalize_gaze_array(samples['x'], samples['y'], self.width(), self.height())
+        gaze_points = np.column_stack((screen_xs, screen_ys))
 
         print(f"Number of parsed gaze points: {len(gaze_points)}")
 
@@ -287,16 +399,69 @@ class GazeVisualizer(QMainWindow):
             return
 
         word_hit_data = parse_word_hit_counts(word_hit_file_path)
-        if gaze_points:
-            self.heatmap_overlay = HeatmapOverlay(gaze_points, word_hit_data, self)
+        if len(gaze_points):
+            bin_size = HeatmapOverlay.default_bin_size(self.width(), self.height())
+            density = session_density(directory, self.width(), self.height(), bin_size)
+            self.closeHeatmap()
+            self.heatmap_overlay = HeatmapOverlay(gaze_points, word_hit_data, self, bin_size=bin_size, density=density)
             self.heatmap_overlay.setGeometry(0, 0, self.width(), self.height())
             self.heatmap_overlay.show()
             self.heatmap_overlay.update()
         else:
             print("No gaze points parsed or heatmap overlay not properly set up.")
 
+    def showComparisonHeatmaps(self, groups):
+        """Show heatmaps comparing groups of sessions ({label: [session directories]}).
+
+        All grids are computed (or read from the session caches) up front in a
+        ComparisonWorker; Page Up and Page Down then switch between the groups,
+        their average and their difference, Escape closes the comparison.
+        """
+        if self.comparison_worker is not None:
+            print("A heatmap comparison is still being computed.")
+            return
+        bin_size = HeatmapOverlay.default_bin_size(self.width(), self.height())
+        self.comparison_worker = ComparisonWorker(groups, self.width(), self.height(), bin_size, self)
+        self.comparison_worker.computed.connect(self.comparisonComputed)
+        self.comparison_worker.finished.connect(self.comparisonFinished)
+        print(f"Computing heatmaps for {len(groups)} group(s)...")
+        self.comparison_worker.start()
+
+    def comparisonFinished(self):
+        self.comparison_worker = None
+
+    def comparisonComputed(self, views, bin_size):
+        if not views:
+            print("None of the selected sessions has calibrated gaze data.")
+            return
+        self.closeHeatmap()
+        self.heatmap_views = views
+        self.heatmap_overlay = HeatmapOverlay(np.empty((0, 2)), [], self, bin_size=bin_size)
+        self.heatmap_overlay.setGeometry(0, 0, self.width(), self.height())
+        self.heatmap_view_index = 0
+        self.showHeatmapView(0)
+        self.heatmap_overlay.show()
+
+    def showHeatmapView(self, index):
+        self.heatmap_view_index = index % len(self.heatmap_views)
+        name, grid, signed = self.heatmap_views[self.heatmap_view_index]
+        self.heatmap_overlay.set_density(grid, signed=signed, title=f"{name} ({self.heatmap_view_index + 1}/{len(self.heatmap_views)})")
+        print(f"Heatmap: {name}")
+
+    def closeHeatmap(self):
+        if self.heatmap_overlay is not None:
+            self.heatmap_overlay.deleteLater()
+            self.heatmap_overlay = None
+        self.heatmap_views = []
+        self.heatmap_live = False
+
     def closeEvent(self, event):
-        # Check if gaze_processor exists and call write_hit_counts_to_file
+        # Stop playback cooperatively and make sure the hit counts are on disk
         if hasattr(self, 'gaze_processor') and self.gaze_processor is not None:
+            self.gaze_processor.stop()
             self.gaze_processor.write_hit_counts_to_file()
+            self.gaze_processor.write_reading_metrics()
+        if self.comparison_worker is not None:
+            self.comparison_worker.computed.disconnect(self.comparisonComputed)
+            self.comparison_worker.wait()
         super().closeEvent(event)
\ No newline at end of file
@@ -1,11 +1,45 @@
 import os, shutil
 from datetime import datetime
-from PyQt5.QtWidgets import QWidget, QPushButton, QVBoxLayout, QLabel, QLineEdit, QHBoxLayout, QListWidget, QListWidgetItem, QTextEdit
+from PyQt5.QtWidgets import QWidget, QPushButton, QVBoxLayout, QLabel, QLineEdit, QHBoxLayout, QListWidget, QListWidgetItem, QTextEdit, QAbstractItemView, QComboBox, QCheckBox, QMessageBox
 from PyQt5.QtGui import QFont
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
 
 from ui_styles import get_button_style, get_exit_button_style, get_label_style
 from config import app_config
+from session_cache import SessionCache
+from session_index import SessionIndex, USER_SORTS, SESSION_SORTS, describe_session
+
+class IndexRefresher(QThread):
+    """ Brings the session index up to date off the UI thread, for one user or for all of them. """
+    refreshed = pyqtSignal(object, int)  # User (None for all) and the number of sessions re-read
+
+    def __init__(self, data_root, user=None, parent=None):
+        super().__init__(parent)
+        self.data_root = data_root
+        self.user = user
+
+    def run(self):
+        index = SessionIndex(self.data_root)  # SQLite connections stay on the thread that opened them
+        try:
+            changed = index.refresh() if self.user is None else index.refresh_user(self.user)
+        finally:
+            index.close()
+        self.refreshed.emit(self.user, changed)
+
+class TrendsWorker(QThread):
+    """ Summarizes every session of a user off the UI thread and writes the trends table. """
+    analyzed = pyqtSignal(str, object, object)  # Path of the trends table, the session summaries and the trends
+
+    def __init__(self, user_folder, parent=None):
+        super().__init__(parent)
+        self.user_folder = user_folder
+
+    def run(self):
+        from aggregation import aggregate_user, user_trends, write_trends_csv
+        summaries = aggregate_user(self.user_folder)
+        trends_path = os.path.join(self.user_folder, "trends.csv")
+        write_trends_csv(summaries, trends_path)
+        self.analyzed.emit(trends_path, summaries, user_trends(summaries))
 
 class UserPage(QWidget):
     def __init__(self, parent=None):
@@ -13,8 +47,13 @@ class UserPage(QWidget):
         self.setFixedSize(parent.size())
         self.parent = parent
         self.selected_user_folder = None
+        self.selected_user = None
+        self.index = SessionIndex()  # Metadata of all users and sessions, so the lists need no folder scans
+        self.refreshers = []
+        self.trends_worker = None
         self.initUI()
-        self.update_user_list()
+        self.update_user_list()  # Show what is already indexed, then catch up in the background
+        self.refresh_index()
 
     def initUI(self):
         self.setWindowTitle('User and Session Management')
@@ -37,10 +76,23 @@ class UserPage(QWidget):
         top_layout.addWidget(self.exit_button, alignment=Qt.AlignRight)
         main_layout.addLayout(top_layout)
 
+        # Filter and sort controls for the user list
+        user_filter_layout = QHBoxLayout()
+        self.user_filter_input = QLineEdit(self)
+        self.user_filter_input.setPlaceholderText("Filter users...")
+        self.user_filter_input.textChanged.connect(self.update_user_list)
+        user_filter_layout.addWidget(self.user_filter_input)
+        self.user_sort_box = QComboBox(self)
+        self.user_sort_box.addItems([f"Sort by {sort}" for sort in USER_SORTS])
+        self.user_sort_box.currentIndexChanged.connect(self.update_user_list)
+        user_filter_layout.addWidget(self.user_sort_box)
+        main_layout.addLayout(user_filter_layout)
+
         # User list widget and related buttons
         user_layout = QHBoxLayout()
         self.user_list_widget = QListWidget(self)
         self.user_list_widget.setMaximumHeight(int(self.parent.screen_height * 0.3))
+        self.user_list_widget.setSelectionMode(QAbstractItemView.ExtendedSelection)  # Several users for heatmap comparison
         user_layout.addWidget(self.user_list_widget)
 
         user_buttons_layout = QVBoxLayout()
@@ -56,13 +108,35 @@ class UserPage(QWidget):
         self.delete_user_button.setStyleSheet(get_button_style(button_height))
         user_buttons_layout.addWidget(self.delete_user_button)
 
+        self.trends_button = QPushButton("User Trends", self)
+        self.trends_button.clicked.connect(self.show_user_trends)
+        self.trends_button.setFixedSize(int(self.parent.screen_width * 0.15), button_height)
+        self.trends_button.setStyleSheet(get_button_style(button_height))
+        user_buttons_layout.addWidget(self.trends_button)
+
         user_layout.addLayout(user_buttons_layout)
         main_layout.addLayout(user_layout)
 
+        # Filter and sort controls for the session list
+        session_filter_layout = QHBoxLayout()
+        self.session_filter_input = QLineEdit(self)
+        self.session_filter_input.setPlaceholderText("Filter sessions by name or text...")
+        self.session_filter_input.textChanged.connect(self.update_session_list)
+        session_filter_layout.addWidget(self.session_filter_input)
+        self.session_sort_box = QComboBox(self)
+        self.session_sort_box.addItems([f"Sort by {sort}" for sort in SESSION_SORTS])
+        self.session_sort_box.currentIndexChanged.connect(self.update_session_list)
+        session_filter_layout.addWidget(self.session_sort_box)
+        self.calibrated_only_box = QCheckBox("Calibrated only", self)
+        self.calibrated_only_box.stateChanged.connect(self.update_session_list)
+        session_filter_layout.addWidget(self.calibrated_only_box)
+        main_layout.addLayout(session_filter_layout)
+
         # Session list widget and related buttons
         session_layout = QHBoxLayout()
         self.session_list_widget = QListWidget(self)
         self.session_list_widget.setMaximumHeight(int(self.parent.screen_height * 0.3))
+        self.session_list_widget.setSelectionMode(QAbstractItemView.ExtendedSelection)
         session_layout.addWidget(self.session_list_widget)
 
         session_buttons_layout = QVBoxLayout()
@@ -84,6 +158,24 @@ class UserPage(QWidget):
         self.delete_session_button.setStyleSheet(get_button_style(button_height))
         session_buttons_layout.addWidget(self.delete_session_button)
 
+        self.compare_button = QPushButton("Compare Heatmaps", self)
+        self.compare_button.clicked.connect(self.compare_heatmaps)
+        self.compare_button.setFixedSize(int(self.parent.screen_width * 0.15), button_height)
+        self.compare_button.setStyleSheet(get_button_style(button_height))
+        session_buttons_layout.addWidget(self.compare_button)
+
+        self.cache_info_button = QPushButton("Cache Info", self)
+        self.cache_info_button.clicked.connect(self.show_cache_info)
+        self.cache_info_button.setFixedSize(int(self.parent.screen_width * 0.15), button_height)
+        self.cache_info_button.setStyleSheet(get_button_style(button_height))
+        session_buttons_layout.addWidget(self.cache_info_button)
+
+        self.clear_cache_button = QPushButton("Clear Cache", self)
+        self.clear_cache_button.clicked.connect(self.clear_cache)
+        self.clear_cache_button.setFixedSize(int(self.parent.screen_width * 0.15), button_height)
+        self.clear_cache_button.setStyleSheet(get_button_style(button_height))
+        session_buttons_layout.addWidget(self.clear_cache_button)
+
         session_layout.addLayout(session_buttons_layout)
         main_layout.addLayout(session_layout)
 
@@ -134,66 +226,176 @@ class UserPage(QWidget):
     def delete_user(self):
         selected_item = self.user_list_widget.currentItem()
         if selected_item:
-            user_name = selected_item.text()
-            user_folder = os.path.join("/Users/borana/Documents/GitHub/DyslexiaProject/Release/data", f"{user_name}_data")
+            user_name = selected_item.data(Qt.UserRole)
+            user_folder = self.index.user_directory(user_name)
+            if not self.confirm_delete(user_folder):
+                return
             try:
                 shutil.rmtree(user_folder)
                 print(f"Deleted user directory: {user_folder}")
+                self.index.remove_user(user_name)
+                if user_folder == self.selected_user_folder:
+                    self.selected_user_folder = self.selected_user = None
+                    self.session_list_widget.clear()
                 self.update_user_list()  # Refresh the list after deletion
-                self.update_session_list()
             except OSError as e:
                 print(f"Error deleting user directory: {e}")
         else:
             print("No user selected to delete.")
 
+    def show_user_trends(self):
+        if not self.selected_user_folder:
+            print("No user selected for trends.")
+            return
+        if self.trends_worker is not None:
+            print("Trends are still being computed.")
+            return
+        self.trends_worker = TrendsWorker(self.selected_user_folder, self)
+        self.trends_worker.analyzed.connect(self.user_trends_ready)
+        self.trends_worker.finished.connect(self.trends_finished)
+        self.trends_button.setEnabled(False)
+        print(f"Analyzing the sessions of {self.selected_user}...")
+        self.trends_worker.start()
+
+    def trends_finished(self):
+        self.trends_worker = None
+        self.trends_button.setEnabled(True)
+
+    def user_trends_ready(self, trends_path, summaries, trends):
+        from aggregation import TREND_METRICS
+        print(f"{len(summaries)} session(s) analyzed, table saved to {trends_path}")
+        for metric in TREND_METRICS:
+            slope = trends[metric]['slope_per_day']
+            print(f"  {metric}: " + (f"{slope:+.3f} per day" if slope is not None else "not enough data"))
+
+    def compare_heatmaps(self):
+        """Compare the selected sessions, the selected users, or all sessions of the selected user."""
+        from aggregation import list_sessions
+        from comparison import session_sort_key
+        selected_sessions = self.session_list_widget.selectedItems()
+        selected_users = self.user_list_widget.selectedItems()
+        if self.selected_user_folder and len(selected_sessions) >= 2:
+            sessions = sorted((os.path.join(self.selected_user_folder, item.data(Qt.UserRole)) for item in selected_sessions), key=session_sort_key)
+            groups = {os.path.basename(session): [session] for session in sessions}
+        elif len(selected_users) >= 2:
+            # One averaged heatmap per user, plus the cohort average
+            groups = {item.data(Qt.UserRole): sorted(list_sessions(self.index.user_directory(item.data(Qt.UserRole))), key=session_sort_key)
+                      for item in selected_users}
+        elif self.selected_user_folder:
+            sessions = sorted(list_sessions(self.selected_user_folder), key=session_sort_key)
+            groups = {os.path.basename(session): [session] for session in sessions}
+        else:
+            print("Select a user, several users or several sessions to compare.")
+            return
+        self.close()
+        self.parent.showComparisonHeatmaps(groups)
+
+    def selected_session_folder(self):
+        selected_session = self.session_list_widget.currentItem()
+        if self.selected_user_folder and selected_session:
+            return os.path.join(self.selected_user_folder, selected_session.data(Qt.UserRole))
+        return None
+
+    def show_cache_info(self):
+        session_folder = self.selected_session_folder()
+        if not session_folder:
+            print("No session selected to inspect the cache.")
+            return
+        cache = SessionCache(session_folder)
+        entries = cache.entries()
+        print(f"Cache of {os.path.basename(session_folder)}: {len(entries)} entries, {cache.total_size() / 1024:.1f} KiB")
+        for name, size, last_used in entries:
+            print(f"  {name}: {size / 1024:.1f} KiB, last used {datetime.fromtimestamp(last_used):%Y-%m-%d %H:%M}")
+
+    def clear_cache(self):
+        session_folder = self.selected_session_folder()
+        if not session_folder:
+            print("No session selected to clear the cache.")
+            return
+        SessionCache(session_folder).clear()
+        print(f"Cache cleared for {session_folder}")
+
+    def confirm_delete(self, folder):
+        """ Ask before a folder is removed with everything in it. """
+        answer = QMessageBox.question(self, "Confirm Deletion",
+                                      f"Delete {folder} and all recordings, calibrations and caches in it?",
+                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if answer != QMessageBox.Yes:
+            print("Deletion cancelled.")
+            return False
+        return True
+
     def delete_session(self):
-        selected_user = self.user_list_widget.currentItem()
         selected_session = self.session_list_widget.currentItem()
-        if selected_user and selected_session:
-            session_folder = os.path.join("/Users/borana/Documents/GitHub/DyslexiaProject/Release/data", selected_user.text() + "_data", selected_session.text())
+        if self.selected_user and selected_session:
+            session_folder = self.index.session_directory(self.selected_user, selected_session.data(Qt.UserRole))
+            if not self.confirm_delete(session_folder):
+                return
             try:
-                # Remove the session directory and its contents
-                os.rmdir(session_folder)
+                # Remove the session directory and its contents (recordings, layouts, caches)
+                shutil.rmtree(session_folder)
                 print(f"Deleted session directory: {session_folder}")
-                self.update_session_list(os.path.join("/Users/borana/Documents/GitHub/DyslexiaProject/Release/data", selected_user.text() + "_data"))
+                self.index.remove_session(self.selected_user, selected_session.data(Qt.UserRole))
+                self.update_session_list()
             except OSError as e:
                 print("Error deleting session directory:", e)
         else:
             print("No session selected for deletion.")
 
+    def refresh_index(self, user=None):
+        refresher = IndexRefresher(self.index.data_root, user, self)
+        refresher.refreshed.connect(self.index_refreshed)
+        refresher.finished.connect(lambda: self.refreshers.remove(refresher))
+        self.refreshers.append(refresher)
+        self.user_list_label.setText("List of Users and Sessions (indexing...)")
+        refresher.start()
+
+    def index_refreshed(self, user, changed):
+        if len(self.refreshers) <= 1:
+            self.user_list_label.setText("List of Users and Sessions:")
+        if user is None or changed:
+            self.update_user_list()
+        if self.selected_user and user in (None, self.selected_user):
+            self.update_session_list()
+
     def update_user_list(self):
+        current = self.user_list_widget.currentItem()
+        current_user = current.data(Qt.UserRole) if current else None
         self.user_list_widget.clear()
-        data_directory = "/Users/borana/Documents/GitHub/DyslexiaProject/Release/data"
         font_family, _, _ = get_label_style(self.parent.screen_height)  # Assuming get_label_style is adequate
         custom_font = QFont(font_family, 20)  # You can adjust the size here as needed
-        
-        for folder_name in os.listdir(data_directory):
-            if folder_name.endswith('_data'):
-                user_name = folder_name[:-5]  # Strip '_data' to get the user name
-                item = QListWidgetItem(user_name)
-                item.setFont(custom_font)  # Apply the custom font to the item
-                self.user_list_widget.addItem(item)
-        print("User list updated.")
+        sort = list(USER_SORTS)[self.user_sort_box.currentIndex()]
+
+        for row in self.index.users(self.user_filter_input.text().strip(), sort):
+            item = QListWidgetItem(f"{row['name']}  |  {row['session_count']} session(s)")
+            item.setData(Qt.UserRole, row['name'])  # The list text is a summary; keep the folder name separately
+            item.setFont(custom_font)  # Apply the custom font to the item
+            self.user_list_widget.addItem(item)
+            if row['name'] == current_user:
+                self.user_list_widget.setCurrentItem(item)
 
     def update_session_list(self):
-        if self.selected_user_folder:
+        if self.selected_user:
             self.session_list_widget.clear()
-            sessions = os.listdir(self.selected_user_folder)
             font_family, _, _ = get_label_style(self.parent.screen_height)
             custom_font = QFont(font_family, 20)  # Same font size as the user list for consistency
-            
-            for session in sessions:
-                item = QListWidgetItem(session)
+            sort = list(SESSION_SORTS)[self.session_sort_box.currentIndex()]
+
+            for row in self.index.sessions(self.selected_user, self.session_filter_input.text().strip(), sort,
+                                           self.calibrated_only_box.isChecked()):
+                item = QListWidgetItem(describe_session(row))
+                item.setData(Qt.UserRole, row['name'])
                 item.setFont(custom_font)  # Apply the custom font to the item
                 self.session_list_widget.addItem(item)
-            print("Session list updated for", os.path.basename(self.selected_user_folder))
 
     def user_selected(self):
         selected_item = self.user_list_widget.currentItem()
         if selected_item:
-            self.selected_user_folder = os.path.join("/Users/borana/Documents/GitHub/DyslexiaProject/Release/data", selected_item.text() + "_data")
+            self.selected_user = selected_item.data(Qt.UserRole)
+            self.selected_user_folder = self.index.user_directory(self.selected_user)
             self.update_session_list()
-            print(f"User selected: {selected_item.text()}")
+            self.refresh_index(self.selected_user)  # Picks up recordings made since the page was opened
+            print(f"User selected: {self.selected_user}")
         else:
             print("No user selected.")
 
@@ -202,6 +404,7 @@ class UserPage(QWidget):
             timestamp = datetime.now().strftime("%d_%m_%Y_%H_%M")
             session_folder = os.path.join(self.selected_user_folder, timestamp)
             os.makedirs(session_folder, exist_ok=True)
+            self.index.add_session(self.selected_user, timestamp)
             self.update_session_list()
             print(f"Session created: {session_folder}")
         else:
@@ -210,7 +413,7 @@ class UserPage(QWidget):
     def session_selected(self):
         selected_item = self.session_list_widget.currentItem()
         if selected_item:
-            selected_session_folder = os.path.join(self.selected_user_folder, selected_item.text())
+            selected_session_folder = os.path.join(self.selected_user_folder, selected_item.data(Qt.UserRole))
             app_config.session_directory = selected_session_folder
             print(f"Session selected: {selected_session_folder}")
         else:
@@ -219,8 +422,9 @@ class UserPage(QWidget):
     def add_user(self):
         user_name = self.new_user_input.text().strip()
         if user_name:
-            user_folder = os.path.join("/Users/borana/Documents/GitHub/DyslexiaProject/Release/data", user_name + "_data")
+            user_folder = self.index.user_directory(user_name)
             os.makedirs(user_folder, exist_ok=True)
+            self.index.add_user(user_name)
             self.update_user_list()
             print(f"User added: {user_name}")
 
@@ -230,5 +434,8 @@ class UserPage(QWidget):
 
     def closeEvent(self, event):
         super().closeEvent(event)
+        for refresher in self.refreshers:
+            refresher.refreshed.disconnect(self.index_refreshed)
+        self.index.close()
         self.parent.updateTextDisplay()  # Refresh the display in GazeVisualizer
         self.parent.showUI()  # Restore UI elements after calibration
@@ -0,0 +1,71 @@
+# word_index.py
+from bisect import bisect_right
+
+import numpy as np
+
+
+class WordIndex:
+    """ Line-band index over word bounding boxes for fast gaze-to-word lookup.
+
+    Words are grouped into bands by their top edge (one band per text line) and
+    sorted by left edge inside each band, so a point resolves to a word with two
+    binary searches instead of a scan over every box. Bands are assumed not to
+    overlap vertically, which holds for the line layout built by text_view.layout_text.
+    Boxes follow QRect.contains semantics: left <= x < left + width.
+    """
+    def __init__(self, boxes):
+        boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+        left, top, width, height = boxes.T
+        self.band_tops = np.unique(top)
+        band = np.searchsorted(self.band_tops, top)
+        self.stride = int(max((left + width).max(initial=0), 0)) + 1
+
+        order = np.lexsort((left, band))
+        self.order = order
+        self.band = band[order]
+        self.left = left[order]
+        self.top = top[order]
+        self.right = (left + width)[order]
+        self.bottom = (top + height)[order]
+        self.keys = self.band * self.stride + self.left
+
+        # Plain lists keep the per-sample lookup free of numpy call overhead
+        self._band_tops_list = self.band_tops.tolist()
+        self._keys_list = self.keys.tolist()
+
+    @classmethod
+    def from_layout(cls, word_layout):
+        """Build the index from a text_view.WordLayout."""
+        return cls(word_layout.boxes)
+
+    def __len__(self):
+        return len(self.order)
+
+    def lookup(self, x, y):
+        """Return the index of the word containing (x, y), or -1."""
+        band = bisect_right(self._band_tops_list, y) - 1
+        if band < 0 or x < 0 or x >= self.stride:
+            return -1
+        candidate = bisect_right(self._keys_list, band * self.stride + x) - 1
+        if candidate < 0 or self.band[candidate] != band:
+            return -1
+        if x < self.right[candidate] and y < self.bottom[candidate]:
+            return int(self.order[candidate])
+        return -1
+
+    def lookup_many(self, xs, ys):
+        """Vectorized lookup: word index for every (x, y) sample, -1 where no word is hit."""
+        xs = np.asarray(xs, dtype=np.int64)
+        ys = np.asarray(ys, dtype=np.int64)
+        result = np.full(xs.shape, -1, dtype=np.int64)
+        if not len(self.order):
+            return result
+
+        band = np.searchsorted(self.band_tops, ys, side='right') - 1
+        inside = (band >= 0) & (xs >= 0) & (xs < self.stride)
+        candidate = np.searchsorted(self.keys, band * self.stride + np.clip(xs, 0, self.stride - 1), side='right') - 1
+        candidate = np.clip(candidate, 0, None)
+        inside &= (self.band[candidate] == band) & (xs >= self.left[candidate])
+        inside &= (xs < self.right[candidate]) & (ys < self.bottom[candidate])
+        result[inside] = self.order[candidate[inside]]
+        return result